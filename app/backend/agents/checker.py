@@ -1,15 +1,5 @@
 from crewai import Agent
-from crewai import Agent, LLM
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-llm = LLM(
-    model=os.getenv("GEMINI_MODEL"),
-    api_key=os.getenv("GEMINI_API_KEY"),
-    temperature=0.1
-)
+from .llm import llm
 
 def get_rule_checker():
     return Agent(
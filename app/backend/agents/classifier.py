@@ -1,16 +1,6 @@
 from crewai import Agent
 from textwrap import dedent
-from crewai import Agent, LLM
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-llm = LLM(
-    model=os.getenv("GEMINI_MODEL"),
-    api_key=os.getenv("GEMINI_API_KEY"),
-    temperature=0.1
-)
+from .llm import llm
 
 def get_document_classifier():
     return Agent(
@@ -0,0 +1,59 @@
+import os
+import numpy as np
+from backend.llm_gateway import estimate_tokens
+from backend.rag import get_embeddings, split_document
+
+# Default token budget per task in context-budget mode
+CREW_CONTEXT_BUDGET = int(os.getenv("CREW_CONTEXT_BUDGET", "4000"))
+
+# What each pruned task looks for in the document
+TASK_QUERIES = {
+    "fields": "key fields such as dates, names, parties, addresses, amounts, totals, tax, account, invoice and reference numbers",
+    "tables": "tables with rows and columns, line items, descriptions, quantities, unit prices, rates and totals",
+}
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def select_chunks(chunks, scores, budget):
+    # Highest scoring chunks that fit the budget, returned in document order
+    selected = []
+    used = 0
+    for index in np.argsort(-scores):
+        tokens = estimate_tokens(chunks[index])
+        if used + tokens > budget:
+            continue
+        selected.append(int(index))
+        used += tokens
+    return sorted(selected), used
+
+
+def budget_context(text, tasks=TASK_QUERIES, budget=CREW_CONTEXT_BUDGET):
+    # Returns ({task: context text}, report). Documents that already fit the
+    # budget are passed through without embedding anything.
+    document_tokens = estimate_tokens(text)
+    if document_tokens <= budget:
+        report = {"budget": budget, "document_tokens": document_tokens, "pruned": False}
+        return {task: text for task in tasks}, report
+
+    chunks = split_document(text)
+    embeddings = get_embeddings()
+    chunk_vectors = normalize(embeddings.embed_documents(chunks))
+
+    contexts = {}
+    report = {"budget": budget, "document_tokens": document_tokens, "pruned": True, "chunks": len(chunks), "tasks": {}}
+    for task, query in tasks.items():
+        scores = chunk_vectors @ normalize(embeddings.embed_query(query))
+        selected, used = select_chunks(chunks, scores, budget)
+        contexts[task] = "\n...\n".join(chunks[index] for index in selected)
+        report["tasks"][task] = {
+            "selected_chunks": len(selected),
+            "context_tokens": used,
+            "pruned_tokens": max(document_tokens - used, 0),
+            "pruned_ratio": round(1 - used / document_tokens, 3),
+        }
+    return contexts, report
@@ -7,28 +7,79 @@ from .rules import get_rule_suggester
 from .checker import get_rule_checker
 
 
-from crewai import Crew, Task, Process
-from crewai_tools import FileWriterTool, FileReadTool
+from crewai import Task
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from backend.llm_gateway import track_usage
+from backend.rule_library import lookup_rules, store_rules
+from .context import budget_context
+from .rule_engine import evaluate_rules, merge_llm_results, validation_report
+import contextvars
 import os
+import time
 
+CREW_MAX_PARALLEL = int(os.getenv("CREW_MAX_PARALLEL", "5"))
 
-def read_file(file_path: str, is_json: bool = False):
-    file_path = os.path.abspath(file_path)
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File not found: {file_path}")
 
+def parse_output(raw: str, is_json: bool = False):
+    cleaned_text = re.sub(r"```[\w]*\n(.*?)```", r"\1", raw, flags=re.DOTALL).strip()
+    if not is_json:
+        return cleaned_text
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-            cleaned_text = re.sub(r"```[\w]*\n(.*?)```", r"\1", content, flags=re.DOTALL)
-            if is_json:
-                return json.loads(cleaned_text)
-            return cleaned_text.strip()
-    except Exception as e:
-        print(f"Error reading file {file_path}: {e}")
-        raise
-
-def run_crew_pipeline(cleaned_text: str):
+        return json.loads(cleaned_text)
+    except json.JSONDecodeError:
+        # Models sometimes wrap the JSON in a sentence
+        match = re.search(r"[\[{].*[\]}]", cleaned_text, flags=re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(0))
+            except json.JSONDecodeError:
+                pass
+        print(f"Could not parse task output as JSON: {cleaned_text[:200]}")
+        return cleaned_text
+
+def run_timed(task, inputs):
+    start = time.perf_counter()
+    if isinstance(task, Task):
+        context = "\n\n".join(inputs.values()) or None
+        output = task.execute_sync(agent=task.agent, context=context).raw
+    else:
+        output = task(inputs)
+    return output, round((time.perf_counter() - start) * 1000, 1)
+
+def run_task_graph(tasks, dependencies=None):
+    # tasks is {name: Task or callable({dependency: output}) -> str}; a task's
+    # dependencies are the tasks in its `context` plus the names listed in
+    # `dependencies`. Every task starts as soon as all of its dependencies
+    # have finished, independent tasks run concurrently. Returns the raw
+    # output text of every task.
+    names = {id(task): name for name, task in tasks.items()}
+    extra = dependencies or {}
+    dependencies = {}
+    for name, task in tasks.items():
+        context = getattr(task, "context", None)
+        dependencies[name] = [names[id(dep)] for dep in (context if isinstance(context, list) else [])]
+        dependencies[name] += extra.get(name, [])
+
+    outputs = {}
+    timings = {}
+    pending = dict(tasks)
+    running = {}
+    with ThreadPoolExecutor(max_workers=CREW_MAX_PARALLEL) as executor:
+        while pending or running:
+            ready = [name for name in pending if all(dep in outputs for dep in dependencies[name])]
+            for name in ready:
+                task = pending.pop(name)
+                inputs = {dep: outputs[dep] for dep in dependencies[name]}
+                # Copy of the caller's context so LLM usage is metered per request
+                running[executor.submit(contextvars.copy_context().run, run_timed, task, inputs)] = name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                outputs[name], timings[name] = future.result()
+    return outputs, timings
+
+def run_crew_pipeline(cleaned_text: str, refresh_rules: bool = False, context_budget: int = None):
     # Agents
     classifier_agent = get_document_classifier()
     field_extractor_agent = get_field_extractor()
@@ -37,69 +88,107 @@ def run_crew_pipeline(cleaned_text: str):
     rule_checker_agent = get_rule_checker()
 
 
+    # Context-budget mode: the field and table tasks only get the chunks
+    # most relevant to them, up to context_budget tokens each
+    contexts = {"fields": cleaned_text, "tables": cleaned_text}
+    context_report = None
+    if context_budget:
+        start = time.perf_counter()
+        contexts, context_report = budget_context(cleaned_text, budget=context_budget)
+        context_report["ms"] = round((time.perf_counter() - start) * 1000, 1)
+
     # Tasks
     classify_task = Task(
         description=f"Classify this document:\n\n{cleaned_text}",
         expected_output="Invoice, Receipt, Bank Statement, Payslip, Legal agreements (NDAs, contracts, MoUs), Resumes/CVs, Research papers, Compliance forms, Business proposals, Insurance policies, Meeting minutes or Other.",
-        agent=classifier_agent,
-        output_file="classification_result.txt"
+        agent=classifier_agent
     )
 
     field_task = Task(
-        description=f"Extract key-value fields:\n\n{cleaned_text}",
+        description=f"Extract key-value fields:\n\n{contexts['fields']}",
         expected_output="JSON with all key fields (e.g. date, sender, amount, etc.)",
-        agent=field_extractor_agent,
-        output_file="fields_result.json"
+        agent=field_extractor_agent
     )
 
     table_task = Task(
-        description=f"Extract all tables:\n\n{cleaned_text}",
+        description=f"Extract all tables:\n\n{contexts['tables']}",
         expected_output="JSON in the format {table1: ..., table2: ...}",
-        agent=table_extractor_agent,
-        output_file="tables_result.json"
+        agent=table_extractor_agent
     )
 
     rule_task = Task(
-        description=f"Suggest some logical validation rules:\n\n{cleaned_text}",
+        description=(
+            f"The document type is given in the context. Suggest some logical validation rules "
+            f"that apply to every document of this type, using this document as an example:\n\n{cleaned_text}"
+        ),
         expected_output="List of basic rules like 'amount must be > 0', 'GST number must match regex XYZ', etc. ",
-        agent=rule_suggester_agent,
-        output_file="rules_result.json"
+        agent=rule_suggester_agent
     )
 
+    # Rules are reused across documents of the same type, the suggester
+    # only runs for unseen types or when a refresh is requested
+    rules_source = {}
+
+    def suggest_rules(inputs):
+        doc_type = inputs["classify"]
+        rules = None if refresh_rules else lookup_rules(doc_type)
+        if rules is not None:
+            rules_source["rules"] = "library"
+            return json.dumps(rules)
+        rules_source["rules"] = "suggester"
+        raw = rule_task.execute_sync(agent=rule_task.agent, context=doc_type).raw
+        store_rules(doc_type, parse_output(raw, is_json=True))
+        return raw
+
     rule_check_task = Task(
         description=(
             f"Here is the extracted document:\n---\n{cleaned_text}\n---\n\n"
             # give rhe rules from previous task
-            f"And below are the rules that this document must satisfy, it is the output of the previous task."
+            f"And below are the rules that this document must satisfy, in the context."
             f"Please validate the document against the rules. "
             f"For each rule, say whether it passed or failed, and explain why. "
             f"DO NOT return markdown or wrap JSON in backticks. Only return the JSON. Do not add any explainations or additional text, just return the JSON."
             f"Return the result in JSON format with individual rule status and an overall 'VALID' or 'INVALID' summary."
         ),
-        context=[rule_task],
         expected_output="A JSON validation report showing pass/fail for each rule and overall document validity.",
-        agent=rule_checker_agent,
-        output_file="validation_result.json"
-    )   
-
-
-    # Crew
-    crew = Crew(
-        agents=[classifier_agent, field_extractor_agent, table_extractor_agent, rule_suggester_agent, rule_checker_agent],
-        tasks=[classify_task, field_task, table_task, rule_task, rule_check_task],
-        process=Process.sequential,
-        verbose=True
+        agent=rule_checker_agent
     )
 
-    results = crew.kickoff()
-    print("results: ", results)
+    # Rules the local engine can compile are checked in Python, only the
+    # rest go to the rule checker agent
+    rule_engine = {"local": 0, "llm": 0}
+
+    def check_rules(inputs):
+        rules = parse_output(inputs["rules"], is_json=True)
+        fields = parse_output(inputs["fields"], is_json=True)
+        results, pending = evaluate_rules(rules, fields, cleaned_text)
+        rule_engine.update(local=len(results), llm=len(pending))
+        if pending:
+            raw = rule_check_task.execute_sync(agent=rule_check_task.agent, context=json.dumps(pending)).raw
+            results = merge_llm_results(results, pending, parse_output(raw, is_json=True))
+        return json.dumps(validation_report(results))
+
+
+    # Rules wait for the document type and the rule check waits for the
+    # rules and fields, everything else runs in parallel
+    start = time.perf_counter()
+    with track_usage() as usage:
+        results, timings = run_task_graph({
+            "classify": classify_task,
+            "fields": field_task,
+            "tables": table_task,
+            "rules": suggest_rules,
+            "rule_check": check_rules,
+        }, dependencies={"rules": ["classify"], "rule_check": ["rules", "fields"]})
+    timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+    print("results: ", results, timings)
     
-    # get data from each file 
-    doc_type = read_file("classification_result.txt", is_json=False)
-    fields = read_file("fields_result.json", is_json=True)
-    tables = read_file("tables_result.json", is_json=True)
-    rules = read_file("rules_result.json", is_json=True)
-    validation_result = read_file("validation_result.json", is_json=True)
+    # Outputs stay in memory and belong to this request only
+    doc_type = parse_output(results["classify"], is_json=False)
+    fields = parse_output(results["fields"], is_json=True)
+    tables = parse_output(results["tables"], is_json=True)
+    rules = parse_output(results["rules"], is_json=True)
+    validation_result = parse_output(results["rule_check"], is_json=True)
 
     print(doc_type, fields, tables, rules, validation_result)
     return {
@@ -107,5 +196,10 @@ def run_crew_pipeline(cleaned_text: str):
         "fields": fields,
         "tables": tables,
         "rules": rules,
-        "validation_result": validation_result
+        "validation_result": validation_result,
+        "rules_source": rules_source.get("rules"),
+        "rule_engine": rule_engine,
+        "context": context_report,
+        "timings_ms": timings,
+        "usage": {"mode": "agents", **usage.as_dict()}
     }
\ No newline at end of file
@@ -0,0 +1,65 @@
+import time
+from backend.llm_cache import cached_generate
+from backend.llm_gateway import track_usage, estimate_tokens
+from .crew import parse_output
+from .llm import llm
+
+# Number of tasks in run_crew_pipeline that embed the whole document
+AGENT_TASKS_WITH_DOCUMENT = 5
+
+FUSED_PROMPT = """
+You are a document analysis system. Analyze the document below and return a single JSON object with exactly these keys:
+
+"type": the document type, one of Invoice, Receipt, Bank Statement, Payslip, Legal agreements (NDAs, contracts, MoUs), Resumes/CVs, Research papers, Compliance forms, Business proposals, Insurance policies, Meeting minutes or Other.
+"fields": an object with all key fields (e.g. date, sender, receiver, amount, etc.).
+"tables": an object in the format {{"table1": ..., "table2": ...}} with every table as rows and columns, or {{}} if there are none.
+"rules": a list of practical validation rules for this document type and content, with detailed names like "Amount Must Be Greater Than Zero" or "Number Must Match Regex XYZ". Do not return an empty list.
+"validation_result": the document validated against those rules, in the format
+    {{"results": [{{"rule": "...", "status": "pass" or "fail", "reason": "..."}}], "overall_validity": "VALID" or "INVALID", "failed rules": [{{"rule": "...", "status": "fail", "reason": "..."}}]}}
+
+Do not hallucinate content. Only return the JSON.
+
+Document:
+---
+{document}
+---
+"""
+
+
+def run_fused_pipeline(cleaned_text: str):
+    # Classification, fields, tables, rules and their validation from one
+    # structured-output call against a single copy of the document
+    start = time.perf_counter()
+    with track_usage() as usage:
+        raw = cached_generate(
+            llm.model,
+            FUSED_PROMPT.format(document=cleaned_text),
+            {"temperature": llm.temperature, "response_mime_type": "application/json"},
+        )
+    elapsed = round((time.perf_counter() - start) * 1000, 1)
+
+    result = parse_output(raw, is_json=True)
+    if not isinstance(result, dict):
+        result = {}
+
+    # Lower bound for the multi-agent mode: the document alone is sent once
+    # per task, before any agent prompt or tool scaffolding
+    usage = usage.as_dict()
+    document_tokens = estimate_tokens(cleaned_text)
+    agents_prompt_tokens = document_tokens * AGENT_TASKS_WITH_DOCUMENT
+    usage.update({
+        "mode": "fused",
+        "document_tokens_estimate": document_tokens,
+        "agents_prompt_tokens_estimate": agents_prompt_tokens,
+        "prompt_token_ratio": round(agents_prompt_tokens / usage["prompt_tokens"], 2) if usage["prompt_tokens"] else None,
+    })
+
+    return {
+        "type": result.get("type", "Unknown"),
+        "fields": result.get("fields", {}),
+        "tables": result.get("tables", {}),
+        "rules": result.get("rules", []),
+        "validation_result": result.get("validation_result", {}),
+        "timings_ms": {"fused": elapsed, "total": elapsed},
+        "usage": usage,
+    }
@@ -0,0 +1,42 @@
+import os
+from crewai import BaseLLM
+from dotenv import load_dotenv
+from backend.llm_cache import cached_generate
+
+load_dotenv()
+
+
+class GatewayLLM(BaseLLM):
+    # crewai LLM that sends every agent call through the shared gateway
+    # (rate limits, retries, accounting) and the LLM response cache
+
+    def __init__(self, model, temperature=0.1, stop=None):
+        # GEMINI_MODEL is written for litellm, e.g. "gemini/gemini-1.5-flash"
+        super().__init__(model=model.split("/", 1)[-1], temperature=temperature, stop=stop)
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system") or None
+        contents = [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [m["content"]]}
+            for m in messages
+            if m["role"] != "system"
+        ]
+        config = {"temperature": self.temperature}
+        if self.stop:
+            config["stop_sequences"] = list(self.stop)[:5]
+        return cached_generate(self.model, contents, config, system_instruction=system)
+
+    def supports_function_calling(self):
+        return False
+
+    def supports_stop_words(self):
+        return True
+
+    def get_context_window_size(self):
+        return 1_000_000
+
+
+llm = GatewayLLM(model=os.getenv("GEMINI_MODEL", "gemini-1.5-flash"), temperature=0.1)
@@ -0,0 +1,367 @@
+import operator
+import os
+import re
+
+# Share of rules that must pass for a document to be VALID. The default keeps
+# the checker's behaviour: any failed rule makes the document INVALID.
+RULES_PASS_RATIO = float(os.getenv("RULES_PASS_RATIO", "1.0"))
+
+NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+DATE_RE = re.compile(
+    r"\b\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}\b"
+    r"|\b\d{1,2}(?:st|nd|rd|th)?\s+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?,?\s+\d{2,4}\b"
+    r"|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{2,4}\b",
+    re.IGNORECASE,
+)
+
+OPERATORS = {
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+    "=": operator.eq, "==": operator.eq, "!=": operator.ne,
+}
+WORD_OPERATORS = {
+    "greater than or equal to": ">=", "less than or equal to": "<=",
+    "greater than": ">", "more than": ">", "above": ">", "less than": "<", "below": "<",
+    "at least": ">=", "at most": "<=", "no more than": "<=", "no less than": ">=",
+    "equal to": "==", "equals": "==", "positive": "> 0", "non negative": ">= 0", "non-negative": ">= 0",
+}
+WORD_NUMBERS = {"zero": "0", "one": "1", "ten": "10", "hundred": "100"}
+
+MUST_CONTAIN_RE = re.compile(r"^must[_ ]contain\s*:\s*(?P<field>.+)$", re.IGNORECASE)
+# Only the checker's token form ("must_have_date"); free text such as
+# "Must have a date" is left to the LLM
+MUST_HAVE_RE = re.compile(r"^must_have_(?P<field>[a-z0-9_]+)$", re.IGNORECASE)
+IF_PRESENT_RE = re.compile(
+    r"^if[_ ]present\s*:\s*(?P<condition>.+?)\s*->\s*must[_ ]contain\s*:\s*(?P<field>.+)$", re.IGNORECASE
+)
+REGEX_RE = re.compile(
+    r"^(?P<field>.+?)\s+(?:must\s+)?(?:match|matches)\s+(?:the\s+)?(?:regex|pattern)\s*:?\s*(?P<pattern>.+)$",
+    re.IGNORECASE,
+)
+# "amount > 0" and the suggester's "amount must be > 0"
+COMPARISON_RE = re.compile(
+    r"^(?P<field>[\w .]+?)\s*(?:(?:must|should)\s+be\s*)?(?P<op>>=|<=|==|!=|>|<|=)\s*(?P<value>-?[\d.,]+)$",
+    re.IGNORECASE,
+)
+WORD_COMPARISON_RE = re.compile(
+    r"^(?P<field>[\w .]+?)\s+(?:must|should)\s+be\s+(?P<op>"
+    + "|".join(re.escape(word) for word in sorted(WORD_OPERATORS, key=len, reverse=True))
+    + r")(?:\s+(?P<value>-?[\d.,]+|\w+))?$",
+    re.IGNORECASE,
+)
+# "Invoice No: A-12" lines in plain text
+TEXT_FIELD_RE = re.compile(r"^\s*(?P<key>[A-Za-z][\w .#()/-]{0,40}?)\s*:\s*(?P<value>\S.*?)\s*$")
+
+
+class UnresolvedField(LookupError):
+    # The rule names a field that can't be pinned down locally; the rule
+    # goes to the LLM instead of being failed
+    pass
+
+
+class AmbiguousField(UnresolvedField):
+    # Matches several extracted fields
+    pass
+
+
+class MissingField(UnresolvedField):
+    # Matches no extracted field
+    pass
+
+
+def key_slug(text):
+    return re.sub(r"[^a-z0-9]", "", str(text).lower())
+
+
+def text_fields(text):
+    # Fields for documents validated without an extraction step:
+    # {"Invoice No": ["A-12"], ...} from "key: value" lines
+    fields = {}
+    for line in (text or "").splitlines():
+        match = TEXT_FIELD_RE.match(line)
+        # "https://..." is a URL, not a field
+        if match and not match["value"].startswith("//"):
+            fields.setdefault(match["key"].strip(), []).append(match["value"])
+    return fields
+
+
+def flatten_fields(fields):
+    # {"Invoice": {"Number": "A1"}} ->
+    # {"invoicenumber": [("invoicenumber", "A1")], "number": [("invoicenumber", "A1")]}
+    # Every value keeps the slug of its full path, so two names for the same
+    # field are not mistaken for two fields
+    index = {}
+
+    def add(key, path, value):
+        index.setdefault(key_slug(key), []).append((path, value))
+
+    def walk(value, path):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(item, path + [str(key)])
+        elif isinstance(value, list) and value:
+            # Line items and repeated values share the path of their list
+            for item in value:
+                walk(item, path)
+        elif path:
+            full = key_slug("".join(path))
+            add(full, full, value)
+            add(path[-1], full, value)
+
+    walk(fields if isinstance(fields, dict) else {}, [])
+    return index
+
+
+class Document:
+    # Extracted fields and text of one document, indexed once for all rules
+
+    def __init__(self, fields, text):
+        self.fields = flatten_fields(fields)
+        self.text = text or ""
+        self.lower_text = self.text.lower()
+
+    def matches(self, name):
+        # [(path, value)] for the field called `name`; "amount" also matches
+        # "Total Amount", "amount_due", ... when no field is called "amount"
+        slug = key_slug(name)
+        if not slug:
+            return []
+        if slug in self.fields:
+            return self.fields[slug]
+        return [match for key, matches in self.fields.items() if slug in key for match in matches]
+
+    def values(self, name):
+        matches = self.matches(name)
+        if not matches:
+            raise MissingField(name)
+        if len({path for path, _ in matches}) > 1:
+            raise AmbiguousField(name)
+        return [value for _, value in matches]
+
+    def has(self, name):
+        # Presence holds whichever of the matching fields was meant
+        if any(value not in (None, "", [], {}) for _, value in self.matches(name)):
+            return True
+        words = re.sub(r"[_\s]+", " ", name).strip().lower()
+        return bool(words) and words in self.lower_text
+
+
+def to_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_RE.search(str(value).replace(",", ""))
+    return float(match.group(0)) if match else None
+
+
+def presence_check(field):
+    def check(doc):
+        if doc.has(field):
+            return True, f"'{field}' is present in the document."
+        return False, f"'{field}' was not found in the extracted fields or text."
+    return check
+
+
+def date_check(field=None):
+    def check(doc):
+        sources = [str(value) for value in doc.values(field)] if field else [doc.text]
+        if any(DATE_RE.search(source) for source in sources):
+            return True, "A date is present in the document."
+        return False, "No date was found in the document."
+    return check
+
+
+def conditional_check(condition, field):
+    def check(doc):
+        if not doc.has(condition):
+            return True, f"'{condition}' is not present, so the rule does not apply."
+        if doc.has(field):
+            return True, f"'{condition}' is present and so is '{field}'."
+        return False, f"'{condition}' is present but '{field}' is missing."
+    return check
+
+
+def regex_check(field, pattern):
+    compiled = re.compile(pattern)
+
+    def check(doc):
+        values = [str(value) for value in doc.values(field) if value not in (None, "")]
+        if not values:
+            return False, f"'{field}' is empty."
+        bad = [value for value in values if not compiled.fullmatch(value.strip())]
+        if bad:
+            return False, f"'{field}' value '{bad[0]}' does not match {pattern}."
+        return True, f"'{field}' matches {pattern}."
+    return check
+
+
+def comparison_check(field, op, limit):
+    compare = OPERATORS[op]
+
+    def check(doc):
+        numbers = [to_number(value) for value in doc.values(field)]
+        numbers = [number for number in numbers if number is not None]
+        if not numbers:
+            return False, f"No numeric value found for '{field}'."
+        bad = [number for number in numbers if not compare(number, limit)]
+        if bad:
+            return False, f"'{field}' is {bad[0]:g}, expected {op} {limit:g}."
+        return True, f"'{field}' is {numbers[0]:g} ({op} {limit:g})."
+    return check
+
+
+def resolve_comparison(op, value):
+    # (">", "10"), ("greater than", "zero"), ("positive", None) -> (op, limit)
+    op = op if op in OPERATORS else WORD_OPERATORS.get(op.lower())
+    if op is None:
+        return None
+    if " " in op:  # "positive" -> "> 0"
+        if value not in (None, ""):
+            return None
+        op, value = op.split()
+    if value is None:
+        return None
+    limit = to_number(WORD_NUMBERS.get(str(value).lower(), value))
+    return None if limit is None else (op, limit)
+
+
+def strip_pattern(pattern):
+    pattern = pattern.strip()
+    if pattern.endswith("$."):  # end of the sentence, not of the pattern
+        pattern = pattern[:-1]
+    if len(pattern) > 1 and pattern[0] == pattern[-1] and pattern[0] in "'\"`/":
+        pattern = pattern[1:-1]
+    return pattern
+
+
+def compile_text_rule(rule):
+    text = rule.strip().strip("-*• ").strip()
+
+    match = IF_PRESENT_RE.match(text)
+    if match:
+        return conditional_check(match["condition"].strip(), match["field"].strip())
+    match = MUST_CONTAIN_RE.match(text)
+    if match:
+        return presence_check(match["field"].strip())
+    match = MUST_HAVE_RE.match(text)
+    if match:
+        field = match["field"].replace("_", " ").strip()
+        return date_check() if field.lower() == "date" else presence_check(field)
+    match = REGEX_RE.match(text)
+    if match:
+        try:
+            return regex_check(match["field"].strip(), strip_pattern(match["pattern"]))
+        except re.error:
+            return None
+    match = COMPARISON_RE.match(text) or WORD_COMPARISON_RE.match(text)
+    if match:
+        comparison = resolve_comparison(match["op"], match["value"])
+        if comparison:
+            return comparison_check(match["field"].strip(), *comparison)
+    return None
+
+
+def compile_dict_rule(rule):
+    # {"field": "gst_number", "validationType": "regex", "pattern": "..."}
+    field = rule.get("field") or rule.get("field_name")
+    kind = key_slug(rule.get("validationType") or rule.get("validation_type") or rule.get("type") or "")
+    value = next((rule[key] for key in ("pattern", "regex", "value", "threshold") if key in rule), None)
+
+    if field and kind:
+        if kind in ("required", "notempty", "notnull", "presence", "mustcontain", "exists"):
+            return presence_check(field)
+        if kind in ("date", "isdate", "validdate", "dateformat") and value is None:
+            return date_check(field)
+        if kind in ("regex", "pattern", "format", "match", "matches") and isinstance(value, str):
+            try:
+                return regex_check(field, strip_pattern(value))
+            except re.error:
+                return None
+        # "greaterThan", "greater_than", ">="
+        word = re.sub(r"(?<!^)([A-Z])", r" \1", str(rule.get("validationType") or rule.get("type")))
+        comparison = resolve_comparison(word.replace("_", " ").strip(), value)
+        return comparison_check(field, *comparison) if comparison else None
+
+    # Dict that only wraps a rule string
+    for key in ("rule", "expression", "condition"):
+        if isinstance(rule.get(key), str):
+            return compile_text_rule(rule[key])
+    return None
+
+
+def compile_rule(rule):
+    # Returns check(doc) -> (passed, reason), or None when the rule is not
+    # in a form we can evaluate locally
+    if isinstance(rule, str):
+        return compile_text_rule(rule)
+    if isinstance(rule, dict):
+        return compile_dict_rule(rule)
+    return None
+
+
+def rule_label(rule):
+    if isinstance(rule, dict):
+        for key in ("rule", "name", "rule_name", "ruleName", "description"):
+            if isinstance(rule.get(key), str):
+                return rule[key]
+        parts = [rule.get("field"), rule.get("validationType") or rule.get("validation_type") or rule.get("type")]
+        parts.append(next((rule[key] for key in ("pattern", "regex", "value", "threshold") if key in rule), None))
+        if rule.get("field"):
+            return " ".join(str(part) for part in parts if part is not None)
+    return str(rule)
+
+
+def normalize_rules(rules):
+    # The suggester returns a list, {"rules": [...]} or {name: expression}
+    if isinstance(rules, dict):
+        if isinstance(rules.get("rules"), list):
+            return rules["rules"]
+        return [{"rule": name, "expression": value} if isinstance(value, str) else value for name, value in rules.items()]
+    if isinstance(rules, list):
+        return rules
+    if isinstance(rules, str):
+        return [line for line in rules.splitlines() if line.strip()]
+    return []
+
+
+def evaluate_rules(rules, fields, text):
+    # Returns (results, pending): a result dict for every rule that could be
+    # evaluated, and the rules that still need the LLM checker
+    doc = Document(fields, text)
+    results = []
+    pending = []
+    for rule in normalize_rules(rules):
+        check = compile_rule(rule)
+        if check is None:
+            pending.append(rule)
+            continue
+        try:
+            passed, reason = check(doc)
+        except UnresolvedField:
+            pending.append(rule)
+            continue
+        results.append({"rule": rule_label(rule), "status": "pass" if passed else "fail", "reason": reason})
+    return results, pending
+
+
+def validation_report(results):
+    failed = [result for result in results if str(result.get("status", "")).lower() != "pass"]
+    passed = len(results) - len(failed)
+    valid = bool(results) and passed / len(results) >= RULES_PASS_RATIO
+    return {
+        "results": results,
+        "overall_validity": "VALID" if valid else "INVALID",
+        "failed rules": failed,
+    }
+
+
+def merge_llm_results(results, pending, llm_result):
+    # Adds the LLM checker's verdicts for the pending rules; rules it did not
+    # answer count as failed
+    answered = llm_result.get("results") if isinstance(llm_result, dict) else None
+    if isinstance(answered, list):
+        return results + [result for result in answered if isinstance(result, dict)]
+    return results + [
+        {"rule": rule_label(rule), "status": "fail", "reason": "The rule checker returned no result for this rule."}
+        for rule in pending
+    ]
@@ -0,0 +1,62 @@
+import math
+import re
+from collections import Counter, defaultdict
+from heapq import nlargest
+from operator import itemgetter
+
+# "INV-2024-001" and "22AAAAA0000A1Z5" stay whole tokens, their parts are
+# indexed as well so partial lookups still match
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*")
+PART_RE = re.compile(r"[a-z0-9]+")
+# Identifier-looking query terms: at least one digit and 5+ characters
+ID_RE = re.compile(r"^(?=.*\d)[a-z0-9][a-z0-9\-/.]{4,}$")
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        parts = PART_RE.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    # Okapi BM25 over an in-memory inverted index: term -> [(chunk, tf)]
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((position, tf))
+        count = len(self.lengths)
+        self.avg_length = sum(self.lengths) / count if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query, k):
+        # [(chunk position, score)] best first
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for position, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / (self.avg_length or 1))
+                scores[position] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return nlargest(k, scores.items(), key=itemgetter(1))
+
+    def id_terms(self, query):
+        # Identifier-like query tokens that occur verbatim in the index
+        return [token for token in TOKEN_RE.findall(query.lower()) if ID_RE.match(token) and token in self.postings]
+
+    def size(self):
+        return sum(len(term) + 16 * len(postings) for term, postings in self.postings.items())
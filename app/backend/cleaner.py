@@ -1,42 +1,161 @@
 import io
+import json
 import os
-import google.generativeai as genai
+import re
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
 from PIL import Image
+from backend.llm_cache import cached_generate
+from backend.normalizer import text_quality, NORMALIZER_MIN_QUALITY
 
 # Load environment variables
 load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
 
-if not api_key:
-    raise EnvironmentError("GEMINI_API_KEY not found in environment.")
+MODEL_NAME = "gemini-2.5-flash"
 
-# Configure Gemini
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel("gemini-2.5-flash")
+# Bump when prompts change so cached parse results are not reused
+CLEANER_VERSION = f"3-{MODEL_NAME}"
 
-def clean_text_with_gemini(raw_text: str) -> str:
-    if not raw_text.strip():
-        return "No text provided."
+CLEAN_CHUNK_CHARS = int(os.getenv("CLEAN_CHUNK_CHARS", "12000"))
+CLEAN_CONCURRENCY = int(os.getenv("CLEAN_CONCURRENCY", "4"))
+CLEAN_RETRIES = int(os.getenv("CLEAN_RETRIES", "2"))
+OCR_BATCH_MAX_BYTES = int(os.getenv("OCR_BATCH_MAX_BYTES", str(4 * 1024 * 1024)))
+OCR_BATCH_MAX_IMAGES = int(os.getenv("OCR_BATCH_MAX_IMAGES", "16"))
 
-    prompt = f"""
+def clean_prompt(raw_text):
+    return f"""
         You are an text cleaner.
         The following text has been extracted from a document. It contains formatting issues, broken lines, and possibly incorrect characters. Please clean it up, fix spelling mistakes, and format it into a readable version. Do not hallucinate content. Do not add any additional information. Just return the cleaned text. Do not make any changes.
         Extracted text:
         {raw_text}
     """
 
-    try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        return f"[Gemini Cleanup Error] {str(e)}"
+def split_long_text(text, max_chars):
+    # Paragraphs first, then lines, and only as a last resort a hard cut
+    if len(text) <= max_chars:
+        return [text]
+    for separator in (r"\n\s*\n", r"\n"):
+        parts = [part for part in re.split(separator, text) if part.strip()]
+        if len(parts) > 1:
+            return [piece for part in parts for piece in split_long_text(part, max_chars)]
+    return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+class ChunkedCleaner:
+    # Packs pages into chunks of at most max_chars (splitting only pages that
+    # are too long on their own) and cleans each chunk as soon as it is full,
+    # with at most `concurrency` requests in flight. Chunks that fail are
+    # retried on their own; chunks that still fail keep their raw text.
+    # Pass an LLMGateway with a stand-in backend to run it offline.
+    # Chunks whose text_quality reaches min_quality are already clean and
+    # are kept as-is without an LLM call; pass None to always use the LLM.
+
+    def __init__(self, model=MODEL_NAME, gateway=None, max_chars=CLEAN_CHUNK_CHARS, concurrency=CLEAN_CONCURRENCY, retries=CLEAN_RETRIES, min_quality=NORMALIZER_MIN_QUALITY):
+        self.model = model
+        self.gateway = gateway
+        self.max_chars = max_chars
+        self.retries = retries
+        self.min_quality = min_quality
+        self.local_chunks = 0
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.chunks = []
+        self.futures = []
+        self.current = []
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def clean_chunk(self, chunk):
+        return cached_generate(self.model, clean_prompt(chunk), gateway=self.gateway).strip()
+
+    def submit(self):
+        if not self.current:
+            return
+        chunk = "\n".join(self.current)
+        self.chunks.append(chunk)
+        if self.min_quality is not None and text_quality(chunk) >= self.min_quality:
+            future = Future()
+            future.set_result(chunk)
+            self.local_chunks += 1
+        else:
+            future = self.executor.submit(self.clean_chunk, chunk)
+        self.futures.append(future)
+        self.current = []
+        self.size = 0
+
+    def add(self, text):
+        if not text or not text.strip():
+            return
+        with self.lock:
+            for piece in split_long_text(text, self.max_chars):
+                if self.current and self.size + len(piece) > self.max_chars:
+                    self.submit()
+                self.current.append(piece)
+                self.size += len(piece) + 1
+
+    def finish(self):
+        # Returns (cleaned_text, report); cleaned_text is None if nothing was added
+        with self.lock:
+            self.submit()
+
+        results = [None] * len(self.chunks)
+        errors = {}
+        pending = list(range(len(self.chunks)))
+        futures = dict(zip(pending, self.futures))
+        retried = 0
+
+        for attempt in range(self.retries + 1):
+            failed = []
+            for index in pending:
+                try:
+                    results[index] = futures[index].result()
+                except Exception as e:
+                    errors[index] = str(e)
+                    failed.append(index)
+            pending = failed
+            if not pending or attempt == self.retries:
+                break
+            time.sleep(2 ** attempt)
+            retried += len(pending)
+            futures = {index: self.executor.submit(self.clean_chunk, self.chunks[index]) for index in pending}
+
+        self.executor.shutdown(wait=False)
+        for index in pending:
+            print(f"[Gemini Cleanup Error] chunk {index}: {errors[index]}")
+            results[index] = self.chunks[index]
+
+        report = {
+            "chunks": len(self.chunks),
+            "local_chunks": self.local_chunks,
+            "llm_chunks": len(self.chunks) - self.local_chunks,
+            "retried": retried,
+            "failed": len(pending),
+            "errors": [errors[index] for index in pending],
+        }
+        return ("\n".join(results) if results else None), report
+
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+]
+
+def image_part(image_bytes):
+    # Formats Gemini accepts are sent as-is, anything else is decoded and re-encoded once
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if image_bytes.startswith(signature):
+            return {"mime_type": mime_type, "data": image_bytes}
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return {"mime_type": "image/webp", "data": image_bytes}
+
+    buffered = io.BytesIO()
+    Image.open(io.BytesIO(image_bytes)).save(buffered, format="PNG")
+    return {"mime_type": "image/png", "data": buffered.getvalue()}
 
 def clean_ocr_text_with_gemini(ocr_text, image_bytes):
     # if not ocr_text.strip():
     #     return "no text "
     if isinstance(image_bytes, bytes):
-        image = Image.open(io.BytesIO(image_bytes))
+        image = image_part(image_bytes)
     else:
         image = Image.open(image_bytes)
 
@@ -47,6 +166,97 @@ def clean_ocr_text_with_gemini(ocr_text, image_bytes):
         {ocr_text}
     """
 
-    response = model.generate_content([text, image])
-    response.resolve()
-    return response.text
\ No newline at end of file
+    return cached_generate(MODEL_NAME, [text, image])
+
+def ocr_payload_size(ocr_text, image_bytes):
+    # Images travel base64 encoded inside the request
+    return len(image_bytes) * 4 // 3 + len(ocr_text.encode("utf-8"))
+
+def plan_ocr_batches(items, max_bytes=OCR_BATCH_MAX_BYTES, max_images=OCR_BATCH_MAX_IMAGES):
+    # Greedy packing in document order; an image over the budget on its own
+    # still gets a batch of one
+    batches = []
+    current = []
+    size = 0
+    for index, (ocr_text, image_bytes) in enumerate(items):
+        item_size = ocr_payload_size(ocr_text, image_bytes)
+        if current and (size + item_size > max_bytes or len(current) >= max_images):
+            batches.append(current)
+            current = []
+            size = 0
+        current.append(index)
+        size += item_size
+    if current:
+        batches.append(current)
+    return batches
+
+def clean_ocr_batch_with_gemini(items):
+    # One multimodal request for several images, returns {position: text}
+    # for every image the response actually covers
+    parts = ["""
+        You are a text cleaner.
+        Below are several images, each followed by the text extracted from it using OCR. For every image, refine and correct its OCR text. Do not hallucinate content. Do not add any additional information. Just return the text you see in the image. Do not make any changes. If an image has no text, then explain what the image is about.
+        Return only JSON in this format:
+        {"images": [{"id": 0, "text": "..."}, {"id": 1, "text": "..."}]}
+    """]
+    for position, (ocr_text, image_bytes) in enumerate(items):
+        parts.append(f"Image id {position}. Extracted text:\n{ocr_text}")
+        parts.append(image_part(image_bytes))
+
+    raw = cached_generate(MODEL_NAME, parts, {"response_mime_type": "application/json"})
+    raw = re.sub(r"^```(?:json)?\s*|\s*```$", "", raw.strip())
+    corrected = {}
+    for entry in json.loads(raw).get("images", []):
+        try:
+            position = int(entry["id"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= position < len(items) and isinstance(entry.get("text"), str):
+            corrected[position] = entry["text"]
+    return corrected
+
+def clean_ocr_texts_with_gemini(items, concurrency=CLEAN_CONCURRENCY):
+    # items is a list of (ocr_text, image_bytes). Images are corrected in
+    # batches sized to the payload budget; anything a batch response leaves
+    # out is corrected with a single-image call.
+    results = [None] * len(items)
+    batches = plan_ocr_batches(items)
+
+    def run_batch(batch):
+        if len(batch) == 1:
+            return {}
+        try:
+            return clean_ocr_batch_with_gemini([items[i] for i in batch])
+        except Exception as e:
+            print(f"[Gemini OCR batch error]: {e}")
+            return {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for batch, corrected in zip(batches, executor.map(run_batch, batches)):
+            for position, index in enumerate(batch):
+                results[index] = corrected.get(position)
+
+        errors = []
+
+        def run_single(index):
+            # A failed correction falls back to the plain OCR text
+            try:
+                return clean_ocr_text_with_gemini(*items[index])
+            except Exception as e:
+                print(f"[Gemini Cleanup Error] image {index}: {e}")
+                errors.append(str(e))
+                return items[index][0]
+
+        missing = [index for index, text in enumerate(results) if text is None]
+        for index, text in zip(missing, executor.map(run_single, missing)):
+            results[index] = text
+
+    report = {
+        "images": len(items),
+        "batches": sum(1 for batch in batches if len(batch) > 1),
+        "single_calls": len(missing),
+        "failed": len(errors),
+        "errors": errors,
+    }
+    return results, report
+
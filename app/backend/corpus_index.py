@@ -0,0 +1,348 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+import faiss
+import numpy as np
+from backend.disk_cache import CACHE_DIR
+from backend import vector_store
+from backend.embedding_service import embedding_service
+from backend.rag import split_document
+
+CORPUS_DIR = os.getenv("CORPUS_DIR", os.path.join(CACHE_DIR, "corpus"))
+CORPUS_HNSW_M = int(os.getenv("CORPUS_HNSW_M", "32"))
+CORPUS_EF_CONSTRUCTION = int(os.getenv("CORPUS_EF_CONSTRUCTION", "80"))
+CORPUS_EF_SEARCH = int(os.getenv("CORPUS_EF_SEARCH", "64"))
+# Filters matching at most this many chunks are searched exactly; broader
+# ones search the graph unfiltered and drop the non-matching candidates,
+# fetching at most CORPUS_POSTFILTER_MAX of them
+CORPUS_EXACT_MAX = int(os.getenv("CORPUS_EXACT_MAX", "5000"))
+CORPUS_POSTFILTER_MAX = int(os.getenv("CORPUS_POSTFILTER_MAX", "20000"))
+# "flat" keeps float32 vectors in the graph, "sq8" stores them as 8-bit codes
+# over [-CORPUS_SQ_RANGE, CORPUS_SQ_RANGE] (vectors are unit length, MiniLM
+# coordinates rarely leave +-0.5; larger values are clamped) and re-ranks the
+# candidates with the exact vectors kept in SQLite.
+CORPUS_VECTOR_STORAGE = os.getenv("CORPUS_VECTOR_STORAGE", "flat")
+CORPUS_SQ_RANGE = float(os.getenv("CORPUS_SQ_RANGE", "0.5"))
+# The index file is rewritten after this many added documents (and at shutdown)
+CORPUS_SAVE_EVERY = int(os.getenv("CORPUS_SAVE_EVERY", "100"))
+
+
+def timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        # Mongo and insert_document use naive UTC datetimes
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
+class CorpusIndex:
+    # Chunks of every stored document in one HNSW index (cosine similarity),
+    # with their metadata in SQLite. The SQLite row id is the FAISS id, so a
+    # metadata filter turns into an id selector on the index.
+    #
+    # Every worker keeps its own copy of the index in memory. The exact
+    # vector of each chunk is stored in SQLite as well, so rows stored by
+    # other workers are added from there before each search, and rows missing
+    # from the saved index file (whichever worker saved it last) are added on
+    # load. Rows without a stored vector are re-embedded.
+
+    def __init__(self, directory=CORPUS_DIR, embed=None):
+        self.directory = directory
+        self.embed = embed or embedding_service.embed
+        self.index_path = os.path.join(directory, "corpus.faiss")
+        self.lock = threading.RLock()
+        self.index = None
+        # Every row with an id up to this one is in the index; None until loaded
+        self.synced_id = None
+        self.quantized = CORPUS_VECTOR_STORAGE == "sq8"
+        self.unsaved = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(os.path.join(directory, "chunks.sqlite3"), check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id INTEGER PRIMARY KEY, doc_id TEXT, user_id TEXT, type TEXT COLLATE NOCASE, "
+            "created_at REAL, chunk_index INTEGER, text TEXT)"
+        )
+        if "vector" not in {row[1] for row in self.db.execute("PRAGMA table_info(chunks)")}:
+            self.db.execute("ALTER TABLE chunks ADD COLUMN vector BLOB")
+        for column in ("doc_id", "user_id", "type", "created_at"):
+            self.db.execute(f"CREATE INDEX IF NOT EXISTS chunks_{column} ON chunks ({column})")
+
+    def new_index(self, dim):
+        if self.quantized:
+            hnsw = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit_uniform, CORPUS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            # A fixed range instead of training data, so the first document
+            # does not decide the quantizer for the whole corpus
+            hnsw.train(np.array([[-CORPUS_SQ_RANGE] * dim, [CORPUS_SQ_RANGE] * dim], dtype=np.float32))
+        else:
+            hnsw = faiss.IndexHNSWFlat(dim, CORPUS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = CORPUS_EF_CONSTRUCTION
+        return faiss.IndexIDMap2(hnsw)
+
+    def load(self):
+        with self.lock:
+            if self.synced_id is not None:
+                return
+            indexed = set()
+            if os.path.exists(self.index_path):
+                self.index = faiss.read_index(self.index_path)
+                indexed = set(faiss.vector_to_array(self.index.id_map).tolist())
+            # Rows any worker stored after the index file was written
+            ids = [row[0] for row in self.db.execute("SELECT id FROM chunks ORDER BY id")]
+            missing = [i for i in ids if i not in indexed]
+            self._index_rows(missing)
+            self.synced_id = ids[-1] if ids else 0
+            if missing:
+                self.save()
+
+    def _sync(self, known=None):
+        # Adds rows stored since the last sync, by this or another worker.
+        # SQLite writers are serialized, so committed ids never leave gaps
+        # behind synced_id.
+        ids = [row[0] for row in self.db.execute("SELECT id FROM chunks WHERE id > ? ORDER BY id", (self.synced_id,))]
+        if ids:
+            self._index_rows(ids, known)
+            self.synced_id = ids[-1]
+
+    def _index_rows(self, ids, known=None, batch_size=500):
+        # known: {id: vector} already in memory; others come from SQLite or
+        # are re-embedded when the row has no stored vector
+        known = known or {}
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            vectors = {i: known[i] for i in batch if i in known}
+            lookup = [i for i in batch if i not in vectors]
+            if lookup:
+                marks = ",".join("?" * len(lookup))
+                rows = self.db.execute(f"SELECT id, text, vector FROM chunks WHERE id IN ({marks})", lookup).fetchall()
+                vectors.update((row[0], np.frombuffer(row[2], dtype=np.float32)) for row in rows if row[2] is not None)
+                texts = [row for row in rows if row[2] is None]
+                if texts:
+                    vectors.update(zip([row[0] for row in texts], self.vectors([row[1] for row in texts])))
+            order = [i for i in batch if i in vectors]
+            if order:
+                self._add_vectors(order, np.vstack([vectors[i] for i in order]))
+
+    def vectors(self, texts):
+        vectors = np.asarray(self.embed(texts), dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def _add_vectors(self, ids, vectors):
+        if self.index is None:
+            self.index = self.new_index(vectors.shape[1])
+        self.index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+
+    def save(self):
+        with self.lock:
+            if self.index is None:
+                return
+            tmp = f"{self.index_path}.{os.getpid()}.tmp"
+            faiss.write_index(self.index, tmp)
+            os.replace(tmp, self.index_path)
+            self.unsaved = 0
+
+    def add_document(self, doc_id, text, user_id=None, doc_type=None, created_at=None):
+        chunks = split_document(text or "")
+        if not chunks:
+            return 0
+        # Embed outside the lock, searches keep running meanwhile
+        vectors = self.vectors(chunks)
+        created_at = timestamp(created_at) or time.time()
+
+        self.load()
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                ids = [
+                    self.db.execute(
+                        "INSERT INTO chunks (doc_id, user_id, type, created_at, chunk_index, text, vector) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (str(doc_id), user_id, doc_type, created_at, position, chunk, vectors[position].tobytes()),
+                    ).lastrowid
+                    for position, chunk in enumerate(chunks)
+                ]
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+            self._sync(dict(zip(ids, vectors)))
+            self.unsaved += 1
+            if self.unsaved >= CORPUS_SAVE_EVERY:
+                self.save()
+        return len(chunks)
+
+    def has_document(self, doc_id):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM chunks WHERE doc_id = ? LIMIT 1", (str(doc_id),)).fetchone() is not None
+
+    def filter_sql(self, user_id=None, doc_type=None, created_after=None, created_before=None):
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if doc_type is not None:
+            clauses.append("type = ?")
+            params.append(doc_type)
+        if created_after is not None:
+            clauses.append("created_at >= ?")
+            params.append(timestamp(created_after))
+        if created_before is not None:
+            clauses.append("created_at < ?")
+            params.append(timestamp(created_before))
+        return " AND ".join(clauses), params
+
+    def search(self, query, k=10, **filters):
+        start = time.perf_counter()
+        query_vector = self.vectors([query])
+        embed_ms = (time.perf_counter() - start) * 1000
+
+        self.load()
+        where, params = self.filter_sql(**filters)
+        # One SQLite connection is shared by all threads, so every query runs
+        # under the lock as well
+        with self.lock:
+            self._sync()
+            if self.index is None or self.index.ntotal == 0:
+                return {"results": [], "timings_ms": {"embed": round(embed_ms, 2), "search": 0.0}, "strategy": "empty"}
+
+            search_start = time.perf_counter()
+            rerank = self.quantized and vector_store.RAG_RERANK
+            fetch = k * vector_store.RAG_RERANK_FACTOR if rerank else k
+            if not where:
+                params_ = faiss.SearchParametersHNSW(efSearch=max(CORPUS_EF_SEARCH, fetch))
+                scores, ids = self.index.search(query_vector, fetch, params=params_)
+                strategy = "hnsw"
+            else:
+                # Never reads more than CORPUS_EXACT_MAX + 1 ids into Python
+                allowed = [
+                    row[0] for row in self.db.execute(
+                        f"SELECT id FROM chunks WHERE {where} LIMIT ?", params + [CORPUS_EXACT_MAX + 1]
+                    )
+                ]
+                if len(allowed) <= CORPUS_EXACT_MAX:
+                    scores, ids = self.exact_search(query_vector, allowed, k)
+                    strategy = "exact"
+                else:
+                    scores, ids = self.postfilter_search(query_vector, fetch, where, params)
+                    strategy = "hnsw_postfilter"
+            if rerank and strategy != "exact":
+                scores, ids = self.rerank(query_vector, scores, ids, k)
+                strategy += "+rerank"
+            search_ms = (time.perf_counter() - search_start) * 1000
+
+            hits = [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i >= 0]
+            marks = ",".join("?" * len(hits))
+            rows = {
+                row[0]: row
+                for row in self.db.execute(
+                    f"SELECT id, doc_id, user_id, type, created_at, chunk_index, text FROM chunks WHERE id IN ({marks})",
+                    [i for i, _ in hits],
+                )
+            } if hits else {}
+
+        results = []
+        for chunk_id, score in hits:
+            if chunk_id not in rows:
+                continue
+            _, doc_id, user_id, doc_type, created_at, chunk_index, text = rows[chunk_id]
+            results.append({
+                "document_id": doc_id,
+                "chunk_index": chunk_index,
+                "score": round(score, 4),
+                "text": text,
+                "user_id": user_id,
+                "type": doc_type,
+                "created_at": datetime.fromtimestamp(created_at, timezone.utc).isoformat() if created_at else None,
+            })
+        return {
+            "results": results,
+            "strategy": strategy,
+            "timings_ms": {"embed": round(embed_ms, 2), "search": round(search_ms, 2)},
+        }
+
+    def postfilter_search(self, query_vector, fetch, where, params):
+        # Over-fetches by the inverse of the filter's selectivity (counted in
+        # SQLite, no ids in Python) and keeps the candidates that match,
+        # doubling the fetch while too few of them do
+        matching = self.db.execute(f"SELECT COUNT(*) FROM chunks WHERE {where}", params).fetchone()[0]
+        limit = min(self.index.ntotal, max(CORPUS_POSTFILTER_MAX, fetch))
+        wide = min(limit, max(2 * fetch, int(fetch * self.index.ntotal / max(matching, 1) * 1.5)))
+        while True:
+            search_params = faiss.SearchParametersHNSW(efSearch=max(CORPUS_EF_SEARCH, wide))
+            scores, ids = self.index.search(query_vector, wide, params=search_params)
+            candidates = [int(i) for i in ids[0] if i >= 0]
+            keep = set()
+            for start in range(0, len(candidates), 900):
+                batch = candidates[start:start + 900]
+                marks = ",".join("?" * len(batch))
+                keep.update(
+                    row[0] for row in self.db.execute(f"SELECT id FROM chunks WHERE id IN ({marks}) AND {where}", batch + params)
+                )
+            if len(keep) >= fetch or wide >= limit:
+                break
+            wide = min(limit, wide * 2)
+        hits = [(i, s) for i, s in zip(ids[0], scores[0]) if i in keep][:fetch]
+        return (
+            np.array([[s for _, s in hits]], dtype=np.float32),
+            np.array([[i for i, _ in hits]], dtype=np.int64),
+        )
+
+    def stored_vectors(self, ids):
+        # Exact float32 vectors stored in SQLite, {id: vector}
+        marks = ",".join("?" * len(ids))
+        rows = self.db.execute(f"SELECT id, vector FROM chunks WHERE id IN ({marks}) AND vector IS NOT NULL", ids)
+        return {row[0]: np.frombuffer(row[1], dtype=np.float32) for row in rows}
+
+    def rerank(self, query_vector, scores, ids, k):
+        candidates = [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i >= 0]
+        if not candidates:
+            return scores[:, :k], ids[:, :k]
+        exact = self.stored_vectors([i for i, _ in candidates])
+        rescored = sorted(
+            ((i, float(exact[i] @ query_vector[0]) if i in exact else s) for i, s in candidates),
+            key=lambda item: item[1], reverse=True,
+        )[:k]
+        return (
+            np.array([[s for _, s in rescored]], dtype=np.float32),
+            np.array([[i for i, _ in rescored]], dtype=np.int64),
+        )
+
+    def exact_search(self, query_vector, allowed, k):
+        if not allowed:
+            return np.empty((1, 0), dtype=np.float32), np.empty((1, 0), dtype=np.int64)
+        stored = self.stored_vectors(allowed) if self.quantized else {}
+        vectors = np.vstack([stored[i] if i in stored else self.index.reconstruct(int(i)) for i in allowed])
+        scores = vectors @ query_vector[0]
+        top = np.argsort(-scores)[:k]
+        return scores[top][None, :], np.asarray(allowed, dtype=np.int64)[top][None, :]
+
+    def index_bytes(self):
+        if self.index is None:
+            return 0
+        hnsw = faiss.downcast_index(self.index.index)
+        links = hnsw.hnsw.neighbors.size() * 4
+        return vector_store.index_bytes(hnsw.storage) + links
+
+    def stats(self):
+        with self.lock:
+            documents, chunks = self.db.execute("SELECT COUNT(DISTINCT doc_id), COUNT(*) FROM chunks").fetchone()
+            return {
+                "documents": documents,
+                "chunks": chunks,
+                "indexed_vectors": self.index.ntotal if self.index is not None else 0,
+                "unsaved_documents": self.unsaved,
+                "vector_storage": CORPUS_VECTOR_STORAGE,
+                "index_bytes": self.index_bytes(),
+                "hnsw_m": CORPUS_HNSW_M,
+                "ef_search": CORPUS_EF_SEARCH,
+            }
+
+
+corpus_index = CorpusIndex()
@@ -21,3 +21,24 @@ def get_document(doc_id):
 
 def get_all_documents():
     return list(collection.find())
+
+# Rule sets are read on the /crew request path, which must not wait out
+# pymongo's default 30 s server selection when Mongo is down
+RULE_LIBRARY_TIMEOUT_MS = int(os.getenv("RULE_LIBRARY_TIMEOUT_MS", "500"))
+rules_client = MongoClient(
+    MONGO_URI,
+    serverSelectionTimeoutMS=RULE_LIBRARY_TIMEOUT_MS,
+    connectTimeoutMS=RULE_LIBRARY_TIMEOUT_MS,
+    socketTimeoutMS=RULE_LIBRARY_TIMEOUT_MS * 4,
+)
+rule_sets = rules_client["docAI"]["rule_sets"]
+
+def get_rule_set(doc_type):
+    return rule_sets.find_one({"doc_type": doc_type})
+
+def save_rule_set(doc_type, rules, label=None):
+    rule_sets.update_one(
+        {"doc_type": doc_type},
+        {"$set": {"rules": rules, "label": label or doc_type, "updated_at": datetime.utcnow()}},
+        upsert=True,
+    )
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+
+
+class DiskCache:
+    # Small key/value store on SQLite. WAL mode lets several uvicorn workers
+    # (and OCR pool processes) share one file; entries are evicted least
+    # recently used first once max_bytes or max_entries is exceeded.
+
+    def __init__(self, path, max_bytes=None, max_entries=None, ttl=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB, size INTEGER, created_at REAL, accessed_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+
+    def _connect(self):
+        # One connection per thread and per process, connections must not
+        # cross a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, conn, name):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None and self.ttl and now - row[1] > self.ttl:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            row = None
+
+        if row is None:
+            self._count(conn, "misses")
+            return None
+
+        conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count(conn, "hits")
+        return row[0]
+
+    def set(self, key, value):
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value), now, now),
+        )
+        self._evict(conn)
+
+    def _evict(self, conn):
+        if self.max_entries:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        if self.max_bytes:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS running FROM entries) "
+                "WHERE running > ?)",
+                (self.max_bytes,),
+            )
+        if self.ttl:
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl,))
+
+    def delete(self, key):
+        cursor = self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+        return cursor.rowcount
+
+    def clear(self):
+        cursor = self._connect().execute("DELETE FROM entries")
+        return cursor.rowcount
+
+    def entries(self):
+        rows = self._connect().execute(
+            "SELECT key, size, created_at, accessed_at FROM entries ORDER BY accessed_at DESC"
+        ).fetchall()
+        return [
+            {"key": key, "size": size, "created_at": created_at, "accessed_at": accessed_at}
+            for key, size, created_at, accessed_at in rows
+        ]
+
+    def stats(self):
+        conn = self._connect()
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "entries": count,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
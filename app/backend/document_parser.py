@@ -1,19 +1,32 @@
 import base64
+import hashlib
 import os
 import tempfile
-from PyPDF2 import PdfReader
+import pymupdf
 from docx import Document
-from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import CharacterTextSplitter
 import markdown
 import pytesseract
 from PIL import Image
 import io
-
-import win32com
+import time
+from backend.ocr_cache import get_cached_ocr, set_cached_ocr
+from backend.ocr_preprocess import preprocess_for_ocr, OCR_PREPROCESS, PREPROCESS_SIGNATURE
 
 pytesseract.pytesseract.tesseract_cmd = r"D:\Apps\Tesseract\tesseract.exe"
 
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+A_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+R_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_CONFIG = os.getenv("OCR_CONFIG", "")
+# Also OCR the untouched image to report the speedup of preprocessing
+OCR_BENCHMARK = os.getenv("OCR_BENCHMARK", "0") == "1"
+
+PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", "200"))
+PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", "20"))
+
 def convert_to_pdf(file, extension):
     try:
         if extension == "docx":
@@ -53,14 +66,10 @@ def file_preprocess(file, selected_extension=None):
 
     if selected_extension == "pdf":
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-                temp_pdf.write(file)
-                temp_pdf_path = temp_pdf.name
-
-            loader = PyPDFLoader(temp_pdf_path)
-            pages = loader.load_and_split()
-            for text in pages:
-                final_text += text.page_content.strip() + "\n"
+            if isinstance(file, str):
+                with open(file, "rb") as f:
+                    file = f.read()
+            final_text = "\n".join(text for _, text, _ in iter_pdf_pages(file) if text)
         except Exception as e:
             return "Error loading PDF: " + str(e)
         return final_text.strip() if final_text.strip() else "No text found."
@@ -74,11 +83,14 @@ def file_preprocess(file, selected_extension=None):
         return final_text if final_text else "No text found."
 
     elif selected_extension == "docx":
-        pdf_bytes = convert_to_pdf(file, "docx")
-        if isinstance(pdf_bytes, bytes):
-            return file_preprocess(pdf_bytes, selected_extension="pdf")
-        else:
-            return pdf_bytes  # error message string
+        try:
+            if isinstance(file, str):
+                with open(file, "rb") as f:
+                    file = f.read()
+            final_text = "\n".join(text for _, text, _ in iter_docx_pages(file) if text)
+        except Exception as e:
+            return "Error loading DOCX: " + str(e)
+        return final_text.strip() if final_text.strip() else "No text found."
 
     elif selected_extension == "pptx":
         try:
@@ -95,51 +107,184 @@ def file_preprocess(file, selected_extension=None):
             return "Error loading PPTX: " + str(e)
 
     elif selected_extension in ["jpg", "jpeg", "png"]:
-        try:
-            if isinstance(file, bytes):
-                image = Image.open(io.BytesIO(file))
-            else:
-                image = Image.open(file)
-            text = pytesseract.image_to_string(image).strip()
-            return text if text else "No text found."
-        except Exception as e:
-            return f"[OCR Image Error]: {str(e)}"
+        text = extract_text_from_image(file)
+        return text if text else "No text found."
 
     else:
         raise ValueError("Invalid file extension selected.")
 
-def extract_images_from_pdf(file_bytes):
-    pdf = PdfReader(io.BytesIO(file_bytes))
-    images = []
-
-    for page_index, page in enumerate(pdf.pages):
-        try:
-            if hasattr(page, "images"):
-                for img_index, img_dict in enumerate(page.images):
-                    image_bytes = img_dict.data
-                    try:
-                        image = Image.open(io.BytesIO(image_bytes))
-                        buffered = io.BytesIO()
-                        image.save(buffered, format="PNG")
-                        images.append(buffered.getvalue())
-                    except Exception as e:
-                        print(f"[Image error on page {page_index}]: {e}")
-        except Exception as e:
-            print(f"[PDF page error at index {page_index}]: {e}")
-    return images
-
-
-def extract_text_from_image(image_path_or_bytes):
+def has_text_layer(text):
+    # Scanned pages have no text layer, broken font encodings give mostly
+    # replacement characters; both are treated as "no usable text"
+    alnum = sum(ch.isalnum() for ch in text)
+    garbage = text.count("\ufffd")
+    return alnum >= PDF_MIN_TEXT_CHARS and garbage <= alnum * 0.1
+
+
+def route_pdf_pages(file_bytes, images=None, dpi=PDF_OCR_DPI):
+    # Yields (page_number, route, payload) one page at a time. Pages with a
+    # usable text layer take the "text" route and payload is their text, the
+    # others take the "ocr" route and payload is the page rasterized to PNG.
+    # Embedded images of text pages are appended to `images` when a list is
+    # passed in; on OCR pages they are already part of the page raster.
+    with pymupdf.open(stream=file_bytes, filetype="pdf") as pdf:
+        for page in pdf:
+            try:
+                text = page.get_text().strip()
+            except Exception as e:
+                print(f"[PDF page error at index {page.number}]: {e}")
+                text = ""
+
+            if has_text_layer(text):
+                if images is not None:
+                    for xref, *_ in page.get_images(full=True):
+                        try:
+                            images.append(pdf.extract_image(xref)["image"])
+                        except Exception as e:
+                            print(f"[Image error on page {page.number}]: {e}")
+                yield page.number + 1, "text", text
+            else:
+                pixmap = page.get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY)
+                yield page.number + 1, "ocr", pixmap.tobytes("png")
+
+
+def iter_pdf_pages(file_bytes, images=None):
+    # Yields (page_number, text, route), OCR-routed pages are OCR'd inline
+    for page_number, route, payload in route_pdf_pages(file_bytes, images):
+        if route == "ocr":
+            payload = extract_text_from_image(payload)
+        yield page_number, payload, route
+
+def table_lines(table):
+    # One "a | b | c" line per row. Only direct children are read, a table
+    # nested in a cell gets its own lines after the row it sits in.
+    lines = []
+    for row in table.iterchildren(W_NS + "tr"):
+        cells = []
+        nested = []
+        for cell in row.iterchildren(W_NS + "tc"):
+            cells.append(" ".join(
+                "".join(t.text or "" for t in p.iter(W_NS + "t"))
+                for p in cell.iterchildren(W_NS + "p")
+            ).strip())
+            for inner in cell.iterchildren(W_NS + "tbl"):
+                nested.extend(table_lines(inner))
+        if any(cells):
+            lines.append(" | ".join(cells))
+        lines.extend(nested)
+    return lines
+
+def iter_docx_pages(file_bytes, images=None):
+    # Reads the DOCX directly with python-docx, no conversion to PDF. Yields
+    # (page_number, text, route) like iter_pdf_pages, pages are split on explicit and
+    # last-rendered page breaks. Inline images are appended to `images` as
+    # their original bytes when a list is passed in.
+    document = Document(io.BytesIO(file_bytes))
+    related_parts = document.part.related_parts
+    page_number = 1
+    lines = []
+    current = []
+
+    def flush_line():
+        line = "".join(current).strip()
+        if line:
+            lines.append(line)
+        current.clear()
+
+    for block in document.element.body.iterchildren():
+        if block.tag == W_NS + "tbl":
+            lines.extend(table_lines(block))
+            if images is not None:
+                for node in block.iter(A_NS + "blip"):
+                    part = related_parts.get(node.get(R_NS + "embed"))
+                    if part is not None:
+                        images.append(part.blob)
+            continue
+
+        if block.tag != W_NS + "p":
+            continue
+
+        for node in block.iter():
+            if node.tag == W_NS + "t":
+                current.append(node.text or "")
+            elif node.tag == W_NS + "tab":
+                current.append("\t")
+            elif node.tag in (W_NS + "br", W_NS + "lastRenderedPageBreak"):
+                if node.tag == W_NS + "br" and node.get(W_NS + "type") != "page":
+                    flush_line()
+                    continue
+                flush_line()
+                if lines:
+                    yield page_number, "\n".join(lines), "text"
+                    page_number += 1
+                    lines = []
+            elif node.tag == A_NS + "blip" and images is not None:
+                part = related_parts.get(node.get(R_NS + "embed"))
+                if part is not None:
+                    images.append(part.blob)
+        flush_line()
+
+    if lines:
+        yield page_number, "\n".join(lines), "text"
+
+def dedupe_images(images):
+    # Returns the distinct images (by content hash) and, for every original
+    # image, the index of its distinct copy
+    seen = {}
+    unique_images = []
+    positions = []
+    for image_bytes in images:
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        if digest not in seen:
+            seen[digest] = len(unique_images)
+            unique_images.append(image_bytes)
+        positions.append(seen[digest])
+    return unique_images, positions
+
+
+def ocr_image_with_timings(image_path_or_bytes, timeout=0):
     try:
         if isinstance(image_path_or_bytes, bytes):
-            image = Image.open(io.BytesIO(image_path_or_bytes))
+            image_bytes = image_path_or_bytes
+        elif hasattr(image_path_or_bytes, "read"):
+            image_bytes = image_path_or_bytes.read()
         else:
-            image = Image.open(image_path_or_bytes)
-        text = pytesseract.image_to_string(image)
-        return text.strip()
+            with open(image_path_or_bytes, "rb") as f:
+                image_bytes = f.read()
+
+        # Repeated images (letterheads, stamps, form headers) are OCR'd once
+        cache_config = f"{OCR_CONFIG}|{PREPROCESS_SIGNATURE}"
+        cached = get_cached_ocr(image_bytes, OCR_LANG, cache_config)
+        if cached is not None:
+            return {"text": cached, "timings": {"cached": True}}
+
+        image = Image.open(io.BytesIO(image_bytes))
+        timings = {"cached": False, "original_size": list(image.size)}
+
+        if OCR_BENCHMARK:
+            start = time.perf_counter()
+            pytesseract.image_to_string(image, lang=OCR_LANG, config=OCR_CONFIG, timeout=timeout)
+            timings["raw_ocr_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        if OCR_PREPROCESS:
+            start = time.perf_counter()
+            image = preprocess_for_ocr(image_bytes)
+            timings["preprocess_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            timings["processed_size"] = [image.shape[1], image.shape[0]]
+
+        start = time.perf_counter()
+        text = pytesseract.image_to_string(image, lang=OCR_LANG, config=OCR_CONFIG, timeout=timeout).strip()
+        timings["ocr_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        set_cached_ocr(image_bytes, OCR_LANG, cache_config, text)
+        return {"text": text, "timings": timings}
     except Exception as e:
-        return f"[OCR Image Error] {str(e)}"
-    
+        return {"text": f"[OCR Image Error] {str(e)}", "timings": {}}
+
+
+def extract_text_from_image(image_path_or_bytes, timeout=0):
+    return ocr_image_with_timings(image_path_or_bytes, timeout)["text"]
+
 
 def pdf_embed_html(file_bytes: bytes) -> str:
     base64_pdf = base64.b64encode(file_bytes).decode('utf-8')
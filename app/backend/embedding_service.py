@@ -0,0 +1,208 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+EMBED_DEVICE = os.getenv("EMBED_DEVICE")  # None lets sentence-transformers pick
+EMBED_WARMUP = os.getenv("EMBED_WARMUP", "1") == "1"
+
+
+class EmbeddingJob:
+    # One submit() call; large ones are encoded over several batches
+
+    def __init__(self, texts, future, submitted):
+        self.texts = texts
+        self.future = future
+        self.submitted = submitted
+        self.started = None
+        self.offset = 0
+        self.vectors = []
+
+
+class EmbeddingService:
+    # One copy of the embedding model per process. Callers on any thread
+    # submit texts; a single worker thread merges whatever arrives within
+    # max_wait_ms (up to max_batch texts) into one encode call, so concurrent
+    # document chunking and query embedding share forward passes. Requests
+    # larger than max_batch are encoded a slice at a time, with newly queued
+    # requests taking the front of every batch.
+
+    def __init__(self, model_name=EMBEDDING_MODEL, max_batch=EMBED_MAX_BATCH, max_wait_ms=EMBED_MAX_WAIT_MS, device=EMBED_DEVICE):
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.device = device
+        self.model = None
+        self.requests = queue.Queue()
+        self.worker = None
+        self.start_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.counters = {"requests": 0, "texts": 0, "batches": 0, "errors": 0, "max_batch_texts": 0}
+        self.batch_sizes = deque(maxlen=1000)
+        self.batch_latencies = deque(maxlen=1000)
+        self.queue_waits = deque(maxlen=1000)
+        self.load_ms = None
+
+    def start(self, warmup=EMBED_WARMUP):
+        with self.start_lock:
+            if self.worker is not None:
+                return
+            from sentence_transformers import SentenceTransformer
+
+            start = time.perf_counter()
+            self.model = SentenceTransformer(self.model_name, device=self.device)
+            if warmup:
+                # First forward pass allocates buffers and is much slower
+                self.model.encode(["warmup"] * min(self.max_batch, 8))
+            self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+
+            self.worker = threading.Thread(target=self.run, name="embedding-service", daemon=True)
+            self.worker.start()
+
+    def stop(self):
+        with self.start_lock:
+            if self.worker is None:
+                return
+            self.requests.put(None)
+            self.worker.join(timeout=5)
+            self.worker = None
+
+    def collect(self, active):
+        # Moves queued requests into `active`, waiting up to max_wait for more
+        # while fewer than max_batch texts are pending. Returns False once
+        # stop() was called.
+        pending = sum(len(job.texts) - job.offset for job in active)
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if pending < self.max_batch and remaining > 0:
+                    request = self.requests.get(timeout=remaining)
+                else:
+                    request = self.requests.get_nowait()
+            except queue.Empty:
+                return True
+            if request is None:
+                return False
+            active.append(EmbeddingJob(*request))
+            pending += len(request[0])
+
+    def next_batch(self, active):
+        # Up to max_batch texts, smallest requests first: a query is not
+        # stuck behind a large document, which is encoded a slice at a time
+        batch = []
+        room = self.max_batch
+        for job in sorted(active, key=lambda job: len(job.texts) - job.offset):
+            if room <= 0:
+                break
+            count = min(len(job.texts) - job.offset, room)
+            batch.append((job, job.offset, count))
+            room -= count
+        return batch
+
+    def run(self):
+        active = []
+        running = True
+        while running or active:
+            if not active:
+                request = self.requests.get()
+                if request is None:
+                    return
+                active.append(EmbeddingJob(*request))
+            running = self.collect(active) and running
+            batch = self.next_batch(active)
+            texts = [text for job, offset, count in batch for text in job.texts[offset:offset + count]]
+
+            start = time.perf_counter()
+            try:
+                vectors = self.model.encode(texts, batch_size=self.max_batch).tolist()
+                error = None
+            except Exception as e:
+                error = e
+            latency_ms = (time.perf_counter() - start) * 1000
+
+            finished = []
+            position = 0
+            for job, offset, count in batch:
+                if job.started is None:
+                    job.started = start
+                if error is not None:
+                    job.future.set_exception(error)
+                    finished.append(job)
+                    continue
+                job.vectors.extend(vectors[position:position + count])
+                job.offset += count
+                position += count
+                if job.offset == len(job.texts):
+                    job.future.set_result(job.vectors)
+                    finished.append(job)
+            active = [job for job in active if job not in finished]
+
+            with self.stats_lock:
+                self.counters["requests"] += len(finished)
+                self.counters["texts"] += len(texts)
+                self.counters["batches"] += 1
+                self.counters["errors"] += error is not None
+                self.counters["max_batch_texts"] = max(self.counters["max_batch_texts"], len(texts))
+                self.batch_sizes.append(len(texts))
+                self.batch_latencies.append(latency_ms)
+                self.queue_waits.extend((job.started - job.submitted) * 1000 for job in finished)
+
+    def submit(self, texts):
+        self.start()
+        future = Future()
+        if not texts:
+            future.set_result([])
+            return future
+        self.requests.put((list(texts), future, time.perf_counter()))
+        return future
+
+    def embed(self, texts):
+        return self.submit(texts).result()
+
+    def stats(self):
+        def percentiles(values):
+            values = sorted(values)
+            if not values:
+                return {"avg": 0.0, "p50": 0.0, "p95": 0.0}
+            return {
+                "avg": round(sum(values) / len(values), 2),
+                "p50": round(values[len(values) // 2], 2),
+                "p95": round(values[int(len(values) * 0.95)], 2),
+            }
+
+        with self.stats_lock:
+            return {
+                "model": self.model_name,
+                "loaded": self.model is not None,
+                "load_ms": self.load_ms,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                **self.counters,
+                "batch_texts": percentiles(self.batch_sizes),
+                "batch_latency_ms": percentiles(self.batch_latencies),
+                "queue_wait_ms": percentiles(self.queue_waits),
+            }
+
+
+class ServiceEmbeddings(Embeddings):
+    # langchain Embeddings backed by the shared service, usable by FAISS
+
+    def __init__(self, service):
+        self.service = service
+
+    def embed_documents(self, texts):
+        return self.service.embed(texts)
+
+    def embed_query(self, text):
+        return self.service.embed([text])[0]
+
+
+embedding_service = EmbeddingService()
+embeddings = ServiceEmbeddings(embedding_service)
@@ -0,0 +1,68 @@
+import io
+import os
+from collections import Counter
+from PIL import Image, ImageFilter, ImageStat
+
+MIN_IMAGE_SIDE = int(os.getenv("IMAGE_FILTER_MIN_SIDE", "24"))
+MIN_IMAGE_AREA = int(os.getenv("IMAGE_FILTER_MIN_AREA", "2500"))
+MAX_ASPECT_RATIO = float(os.getenv("IMAGE_FILTER_MAX_ASPECT", "20"))
+MIN_STDDEV = float(os.getenv("IMAGE_FILTER_MIN_STDDEV", "6"))
+MIN_ENTROPY = float(os.getenv("IMAGE_FILTER_MIN_ENTROPY", "1.0"))
+MIN_EDGE_DENSITY = float(os.getenv("IMAGE_FILTER_MIN_EDGE_DENSITY", "0.02"))
+SAMPLE_SIDE = 256
+EDGE_THRESHOLD = 64
+
+# OCR + Gemini correction
+KEEP = "keep"
+# OCR only, Gemini correction only if tesseract actually finds text
+DOWNGRADE = "downgrade"
+# neither OCR nor Gemini
+SKIP = "skip"
+
+
+def classify_image(image_bytes):
+    # Cheap local check run before OCR, returns (decision, reason)
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        width, height = image.size
+    except Exception:
+        return SKIP, "undecodable"
+
+    # Dimension checks only need the header, no pixels are decoded yet
+    if min(width, height) < MIN_IMAGE_SIDE or width * height < MIN_IMAGE_AREA:
+        return SKIP, "too_small"
+    if max(width, height) / min(width, height) > MAX_ASPECT_RATIO:
+        return SKIP, "rule_or_border"
+
+    try:
+        image.draft("L", (SAMPLE_SIDE, SAMPLE_SIDE))
+        sample = image.convert("L")
+        sample.thumbnail((SAMPLE_SIDE, SAMPLE_SIDE))
+    except Exception:
+        return SKIP, "undecodable"
+
+    if ImageStat.Stat(sample).stddev[0] < MIN_STDDEV:
+        return SKIP, "blank"
+    if sample.entropy() < MIN_ENTROPY:
+        return SKIP, "low_entropy"
+
+    # Text produces lots of sharp edges, photos and gradients far fewer
+    edges = sample.filter(ImageFilter.FIND_EDGES)
+    histogram = edges.histogram()
+    edge_density = sum(histogram[EDGE_THRESHOLD:]) / float(sample.width * sample.height)
+    if edge_density < MIN_EDGE_DENSITY:
+        return DOWNGRADE, "low_text_likelihood"
+
+    return KEEP, "text_likely"
+
+
+def filter_images(images):
+    decisions = [classify_image(image_bytes) for image_bytes in images]
+    reasons = Counter(reason for decision, reason in decisions if decision != KEEP)
+    report = {
+        "total": len(images),
+        "skipped": sum(1 for decision, _ in decisions if decision == SKIP),
+        "downgraded": sum(1 for decision, _ in decisions if decision == DOWNGRADE),
+        "reasons": dict(reasons),
+    }
+    return decisions, report
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+import faiss
+import numpy as np
+from backend.bm25 import BM25Index
+from backend.disk_cache import CACHE_DIR
+from backend import vector_store
+
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join(CACHE_DIR, "indexes"))
+RAG_INDEX_RAM_BYTES = int(os.getenv("RAG_INDEX_RAM_BYTES", str(512 * 1024 * 1024)))
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.json"
+VECTORS_FILE = "vectors.npy"
+
+
+def document_hash(document_text):
+    return hashlib.sha256(document_text.encode("utf-8")).hexdigest()
+
+
+def index_key(document_text):
+    # Indexes built with another RAG_VECTOR_STORAGE are not reused
+    return f"{document_hash(document_text)}.{vector_store.RAG_VECTOR_STORAGE}"
+
+
+def read_index(path):
+    # Memory-mapped where the index type supports it, so pages are only
+    # brought into RAM when searched and are shared between workers
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+class DocumentIndex:
+    # FAISS index, BM25 index and chunks of one document
+
+    def __init__(self, key, chunks, index, embeddings, vectors=None):
+        self.key = key
+        self.chunks = chunks
+        self.index = index
+        # Exact float32 vectors (memory-mapped) for re-ranking quantized indexes
+        self.vectors = vectors
+        self.embeddings = embeddings
+        # Rebuilt from the chunks on load, it takes milliseconds
+        self.bm25 = BM25Index(chunks)
+        self.size = vector_store.index_bytes(index) + sum(len(chunk) for chunk in chunks) + self.bm25.size()
+        self.used_at = time.time()
+
+    def search(self, vector, k):
+        # Chunk positions nearest to `vector`, best first
+        ids, _ = vector_store.search(self.index, vector, k, self.vectors if vector_store.RAG_RERANK else None)
+        return [int(i) for i in ids]
+
+
+class IndexRegistry:
+    # Per-document indexes keyed by the hash of the document text. Indexes
+    # are built once, saved under RAG_INDEX_DIR and memory-mapped back on
+    # demand; the least recently used ones are dropped from memory once the
+    # loaded indexes exceed ram_bytes.
+
+    def __init__(self, directory=RAG_INDEX_DIR, ram_bytes=RAG_INDEX_RAM_BYTES):
+        self.directory = directory
+        self.ram_bytes = ram_bytes
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.counters = {"hits": 0, "loads": 0, "builds": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def _remember(self, entry):
+        with self.lock:
+            self.loaded[entry.key] = entry
+            self.loaded.move_to_end(entry.key)
+            total = sum(item.size for item in self.loaded.values())
+            # The newest index always stays, even when it alone exceeds the budget
+            while total > self.ram_bytes and len(self.loaded) > 1:
+                _, evicted = self.loaded.popitem(last=False)
+                total -= evicted.size
+                self.counters["evictions"] += 1
+
+    def _lookup(self, key):
+        with self.lock:
+            entry = self.loaded.get(key)
+            if entry is not None:
+                self.loaded.move_to_end(key)
+                entry.used_at = time.time()
+                self.counters["hits"] += 1
+            return entry
+
+    def load(self, key, embeddings):
+        path = self.path(key)
+        if not os.path.exists(os.path.join(path, CHUNKS_FILE)):
+            return None
+        with open(os.path.join(path, CHUNKS_FILE), encoding="utf-8") as f:
+            chunks = json.load(f)
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        vectors = np.load(vectors_path, mmap_mode="r") if os.path.exists(vectors_path) else None
+        return DocumentIndex(key, chunks, read_index(os.path.join(path, INDEX_FILE)), embeddings, vectors)
+
+    def save(self, entry):
+        # Written to a temporary directory first so readers never see half an index
+        path = self.path(entry.key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(tmp, exist_ok=True)
+        faiss.write_index(entry.index, os.path.join(tmp, INDEX_FILE))
+        with open(os.path.join(tmp, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump(entry.chunks, f)
+        if entry.vectors is not None:
+            np.save(os.path.join(tmp, VECTORS_FILE), entry.vectors)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another worker saved the same document first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def build(self, key, chunks, embeddings):
+        vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+        index = vector_store.build_index(vectors)
+        # Quantized indexes keep the exact vectors on disk for re-ranking
+        entry = DocumentIndex(key, chunks, index, embeddings, vectors if vector_store.is_quantized(index) else None)
+        self.save(entry)
+        vectors_path = os.path.join(self.path(key), VECTORS_FILE)
+        if entry.vectors is not None and os.path.exists(vectors_path):
+            entry.vectors = np.load(vectors_path, mmap_mode="r")
+        return entry
+
+    def get(self, document_text, chunks_fn, embeddings):
+        # Returns the DocumentIndex for this text, building it with
+        # chunks_fn(document_text) the first time
+        key = index_key(document_text)
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry
+
+        with self.key_lock(key):
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry
+            entry = self.load(key, embeddings)
+            counter = "loads"
+            if entry is None:
+                chunks = chunks_fn(document_text)
+                if not chunks:
+                    raise ValueError("Document could not be split into chunks.")
+                entry = self.build(key, chunks, embeddings)
+                counter = "builds"
+            self._remember(entry)
+            with self.lock:
+                self.counters[counter] += 1
+                self.key_locks.pop(key, None)
+            return entry
+
+    def evict(self, key=None):
+        with self.lock:
+            if key is None:
+                removed = len(self.loaded)
+                self.loaded.clear()
+                return removed
+            return int(self.loaded.pop(key, None) is not None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "loaded": len(self.loaded),
+                "loaded_bytes": sum(entry.size for entry in self.loaded.values()),
+                "ram_bytes": self.ram_bytes,
+                "on_disk": sum(1 for name in os.listdir(self.directory) if not name.endswith(".tmp")),
+            }
+
+
+index_registry = IndexRegistry()
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from backend.disk_cache import DiskCache, CACHE_DIR
+from backend.llm_gateway import gateway as default_gateway, current_meter
+
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class LLMCache:
+    # In-memory LRU in front of a DiskCache. The disk tier is shared by all
+    # uvicorn workers, the memory tier is per process.
+
+    def __init__(self, path, memory_entries=LLM_CACHE_MEMORY_ENTRIES, max_bytes=LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL):
+        self.memory = OrderedDict()
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.disk = DiskCache(path, max_bytes=max_bytes, ttl=ttl)
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _remember(self, key, value, created_at):
+        self.memory[key] = (value, created_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and (not self.ttl or time.time() - entry[1] <= self.ttl):
+                self.memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry[0]
+            self.memory.pop(key, None)
+
+        value = self.disk.get(key)
+        with self.lock:
+            if value is None:
+                self.counters["misses"] += 1
+                return None
+            value = value.decode("utf-8")
+            self.counters["disk_hits"] += 1
+            self._remember(key, value, time.time())
+        return value
+
+    def set(self, key, value):
+        self.disk.set(key, value)
+        with self.lock:
+            self._remember(key, value, time.time())
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+        return self.disk.clear()
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            memory_size = len(self.memory)
+        lookups = sum(counters.values())
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        return {
+            "process": {
+                **counters,
+                "memory_entries": memory_size,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            },
+            "disk": self.disk.stats(),
+        }
+
+
+llm_cache = LLMCache(os.path.join(CACHE_DIR, "llm.sqlite3"))
+
+
+def part_digest(part):
+    if isinstance(part, str):
+        return b"text:" + hashlib.sha256(part.encode("utf-8")).digest()
+    if isinstance(part, dict) and "data" in part:
+        return b"image:" + hashlib.sha256(part["data"]).digest()
+    if isinstance(part, dict) and "parts" in part:
+        nested = b"".join(part_digest(p) for p in part["parts"])
+        return b"content:" + part.get("role", "").encode("utf-8") + hashlib.sha256(nested).digest()
+    if hasattr(part, "tobytes"):  # PIL image
+        return b"image:" + hashlib.sha256(part.tobytes()).digest()
+    return b"other:" + hashlib.sha256(repr(part).encode("utf-8")).digest()
+
+
+def cache_key(model_name, parts, generation_config=None, system_instruction=None):
+    digest = hashlib.sha256()
+    if system_instruction:
+        digest.update(part_digest(system_instruction))
+    for part in parts:
+        digest.update(part_digest(part))
+    config = generation_config or {}
+    temperature = config.get("temperature")
+    options = ",".join(f"{k}={config[k]}" for k in sorted(config) if k != "temperature")
+    return f"{model_name}:{temperature}:{options}:{digest.hexdigest()}"
+
+
+def cached_generate(model_name, parts, generation_config=None, system_instruction=None, gateway=None):
+    # Every LLM call goes through here and then through the gateway; only
+    # successful responses are cached
+    if isinstance(parts, str):
+        parts = [parts]
+    key = cache_key(model_name, parts, generation_config, system_instruction)
+
+    text = llm_cache.get(key)
+    if text is not None:
+        meter = current_meter.get()
+        if meter is not None:
+            meter.add(cached=True)
+        return text
+
+    text, _ = (gateway or default_gateway).generate(model_name, parts, generation_config, system_instruction)
+    llm_cache.set(key, text)
+    return text
@@ -0,0 +1,354 @@
+import asyncio
+import contextvars
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import google.generativeai as genai
+from dotenv import load_dotenv
+from backend.disk_cache import CACHE_DIR
+
+load_dotenv()
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Point at a local fake server (REST transport) for offline testing
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+# LLM_RPM and LLM_TPM are the limits of the API key: every worker process on
+# the host draws from the same buckets, kept in SQLite at LLM_LIMITS_PATH (an
+# empty value keeps them per process). LLM_MAX_CONCURRENCY is per process.
+LLM_RPM = int(os.getenv("LLM_RPM", "60"))
+LLM_TPM = int(os.getenv("LLM_TPM", "1000000"))
+LLM_LIMITS_PATH = os.getenv("LLM_LIMITS_PATH", os.path.join(CACHE_DIR, "llm_limits.sqlite3"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+RETRY_ERRORS = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded"}
+IMAGE_TOKENS = 258
+
+
+class GatewayError(Exception):
+    pass
+
+
+class TokenBucket:
+    # Only touched from the gateway event loop, so no locking
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount):
+        amount = min(amount, self.capacity)
+        while True:
+            self.refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def consume(self, amount):
+        # Correction once the real token count is known, may go negative
+        self.refill()
+        self.tokens -= amount
+
+
+class SharedTokenBucket(TokenBucket):
+    # TokenBucket whose state lives in SQLite, so all uvicorn workers share
+    # one limit. Wall-clock time, since monotonic clocks are per process.
+
+    def __init__(self, path, name, per_minute):
+        super().__init__(per_minute)
+        self.path = path
+        self.name = name
+        self.conn = None
+        self.pid = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def _connect(self):
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.pid = os.getpid()
+        return self.conn
+
+    def take(self, amount, force=False):
+        # Takes `amount` and returns 0, or returns the seconds to wait until
+        # it is available. force always takes it, the balance may go negative.
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+            now = time.time()
+            tokens = self.capacity if row is None else min(self.capacity, row[0] + max(now - row[1], 0) * self.rate)
+            wait = 0.0
+            if force or tokens >= amount:
+                tokens -= amount
+            else:
+                wait = (amount - tokens) / self.rate
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (self.name, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    async def acquire(self, amount):
+        amount = min(amount, self.capacity)
+        while True:
+            wait = self.take(amount)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def consume(self, amount):
+        self.take(amount, force=True)
+
+
+class GeminiBackend:
+
+    def __init__(self, api_key=GEMINI_API_KEY, endpoint=GEMINI_API_ENDPOINT):
+        if not api_key:
+            raise EnvironmentError("GEMINI_API_KEY not found in environment.")
+        options = {"api_key": api_key}
+        if endpoint:
+            options["transport"] = "rest"
+            options["client_options"] = {"api_endpoint": endpoint}
+        genai.configure(**options)
+        self.models = {}
+
+    def model(self, model_name, system_instruction=None):
+        key = (model_name, system_instruction)
+        if key not in self.models:
+            self.models[key] = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+        return self.models[key]
+
+    async def generate(self, model_name, parts, generation_config=None, system_instruction=None):
+        model = self.model(model_name, system_instruction)
+        # The sync client works with every transport; the gateway keeps the
+        # number of these threads bounded
+        response = await asyncio.to_thread(model.generate_content, parts, generation_config=generation_config)
+        usage = getattr(response, "usage_metadata", None)
+        return response.text, {
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        }
+
+
+def estimate_tokens(parts, system_instruction=None):
+    if isinstance(parts, str):
+        return len(parts) // 4 + 1
+    total = estimate_tokens(system_instruction) if system_instruction else 0
+    for part in parts:
+        if isinstance(part, dict) and "parts" in part:
+            total += estimate_tokens(part["parts"])
+        elif isinstance(part, str):
+            total += estimate_tokens(part)
+        else:
+            total += IMAGE_TOKENS
+    return total
+
+
+def is_retryable(error):
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRY_STATUS
+    return type(error).__name__ in RETRY_ERRORS
+
+
+class UsageMeter:
+    # Token usage of everything done inside one track_usage() block
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.cached_calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def add(self, usage=None, cached=False):
+        with self.lock:
+            if cached:
+                self.cached_calls += 1
+                return
+            self.calls += 1
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "cached_calls": self.cached_calls,
+                "prompt_tokens": self.prompt_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": self.prompt_tokens + self.output_tokens,
+            }
+
+
+current_meter = contextvars.ContextVar("llm_usage_meter", default=None)
+
+
+@contextmanager
+def track_usage():
+    # Threads started inside the block only report here if they run in a
+    # copy of the caller's context (contextvars.copy_context().run)
+    meter = UsageMeter()
+    token = current_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        current_meter.reset(token)
+
+
+def new_model_stats():
+    return {
+        "calls": 0,
+        "errors": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        "output_tokens": 0,
+        "latency_ms_total": 0.0,
+        "latencies": deque(maxlen=1000),
+    }
+
+
+class LLMGateway:
+    # Every LLM call in the backend goes through one of these. Requests and
+    # tokens per minute are limited with token buckets (shared by all
+    # workers when limits_path is set), at most max_concurrency calls of this
+    # process are in flight, 429/5xx responses are retried with
+    # jittered exponential backoff, and latency/tokens are tracked per model.
+    # The gateway runs its own event loop in a background thread so it can be
+    # used from sync code (generate) as well as from any other event loop
+    # (agenerate).
+
+    def __init__(self, backend=None, rpm=LLM_RPM, tpm=LLM_TPM, max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES, limits_path=LLM_LIMITS_PATH):
+        self.backend = backend
+        self.rpm = rpm
+        self.tpm = tpm
+        self.limits_path = limits_path
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.loop = None
+        self.start_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.models = defaultdict(new_model_stats)
+
+    def start(self):
+        with self.start_lock:
+            if self.loop is not None:
+                return self.loop
+            if self.backend is None:
+                self.backend = GeminiBackend()
+            loop = asyncio.new_event_loop()
+            if self.limits_path:
+                self.requests_bucket = SharedTokenBucket(self.limits_path, f"requests/{self.rpm}", self.rpm)
+                self.tokens_bucket = SharedTokenBucket(self.limits_path, f"tokens/{self.tpm}", self.tpm)
+            else:
+                self.requests_bucket = TokenBucket(self.rpm)
+                self.tokens_bucket = TokenBucket(self.tpm)
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True).start()
+            self.loop = loop
+            return loop
+
+    def record(self, model_name, **values):
+        with self.stats_lock:
+            stats = self.models[model_name]
+            for name, value in values.items():
+                if name == "latency_ms":
+                    stats["latency_ms_total"] += value
+                    stats["latencies"].append(value)
+                else:
+                    stats[name] += value
+
+    async def _generate(self, model_name, parts, generation_config=None, system_instruction=None):
+        estimate = estimate_tokens(parts, system_instruction)
+        attempt = 0
+        while True:
+            async with self.semaphore:
+                await self.requests_bucket.acquire(1)
+                await self.tokens_bucket.acquire(estimate)
+                start = time.perf_counter()
+                try:
+                    text, usage = await self.backend.generate(model_name, parts, generation_config, system_instruction)
+                    error = None
+                except Exception as e:
+                    error = e
+                latency_ms = (time.perf_counter() - start) * 1000
+
+            if error is None:
+                used = usage["prompt_tokens"] + usage["output_tokens"]
+                self.tokens_bucket.consume(max(used - estimate, 0))
+                self.record(model_name, calls=1, latency_ms=latency_ms, **usage)
+                return text, {**usage, "latency_ms": round(latency_ms, 1), "retries": attempt}
+
+            if is_retryable(error) and attempt < self.max_retries:
+                attempt += 1
+                self.record(model_name, retries=1)
+                await asyncio.sleep(random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt)))
+                continue
+
+            self.record(model_name, calls=1, errors=1, latency_ms=latency_ms)
+            raise GatewayError(f"{model_name} request failed after {attempt} retries: {error}") from error
+
+    async def agenerate(self, model_name, parts, generation_config=None, system_instruction=None):
+        meter = current_meter.get()
+        future = asyncio.run_coroutine_threadsafe(
+            self._generate(model_name, parts, generation_config, system_instruction), self.start()
+        )
+        text, usage = await asyncio.wrap_future(future)
+        if meter is not None:
+            meter.add(usage)
+        return text, usage
+
+    def generate(self, model_name, parts, generation_config=None, system_instruction=None):
+        meter = current_meter.get()
+        future = asyncio.run_coroutine_threadsafe(
+            self._generate(model_name, parts, generation_config, system_instruction), self.start()
+        )
+        text, usage = future.result()
+        if meter is not None:
+            meter.add(usage)
+        return text, usage
+
+    def stats(self):
+        with self.stats_lock:
+            result = {}
+            for model_name, stats in self.models.items():
+                latencies = sorted(stats["latencies"])
+                result[model_name] = {
+                    **{k: v for k, v in stats.items() if k not in ("latencies", "latency_ms_total")},
+                    "avg_latency_ms": round(stats["latency_ms_total"] / stats["calls"], 1) if stats["calls"] else 0.0,
+                    "p50_latency_ms": round(latencies[len(latencies) // 2], 1) if latencies else 0.0,
+                    "p95_latency_ms": round(latencies[int(len(latencies) * 0.95)], 1) if latencies else 0.0,
+                }
+        return {
+            "limits": {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "shared": bool(self.limits_path),
+                "max_concurrency": self.max_concurrency,
+            },
+            "models": result,
+        }
+
+
+gateway = LLMGateway()
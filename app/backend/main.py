@@ -4,6 +4,11 @@ from .routers import rag_router as rag
 from .routers import document_router as parse
 from .routers import database_router as store
 from .routers import validate_router as validate
+from .routers import llm_router as llm
+from .routers import search_router as search
+from .ocr import shutdown_ocr_pool
+from .embedding_service import embedding_service
+from .corpus_index import corpus_index
 
 
 app = FastAPI()
@@ -13,3 +18,18 @@ app.include_router(crew.router, prefix="/crew")
 app.include_router(rag.router, prefix="/rag")
 app.include_router(store.router, prefix="/store")
 app.include_router(validate.router, prefix="/validate")
+app.include_router(llm.router, prefix="/llm")
+app.include_router(search.router, prefix="/search")
+
+
+@app.on_event("startup")
+def startup():
+    embedding_service.start()
+    corpus_index.load()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    shutdown_ocr_pool()
+    corpus_index.save()
+    embedding_service.stop()
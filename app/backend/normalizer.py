@@ -0,0 +1,183 @@
+import os
+import re
+import unicodedata
+from collections import Counter
+
+NORMALIZER_MIN_QUALITY = float(os.getenv("NORMALIZER_MIN_QUALITY", "0.85"))
+HEADER_FOOTER_WARMUP = int(os.getenv("HEADER_FOOTER_WARMUP", "4"))
+HEADER_FOOTER_LINES = 2
+
+INVISIBLE_RE = re.compile("[\u00ad\u200b-\u200f\u2060\ufeff]")
+CONTROL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+HYPHEN_BREAK_RE = re.compile(r"(\w)-\n(?=[a-z])")
+SPACES_RE = re.compile("[ \t\u00a0]+")
+COLUMN_GAP_RE = re.compile("[ \t\u00a0]{2,}")
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+DIGITS_RE = re.compile(r"\d+")
+WORD_RE = re.compile(r"[^\W\d_]+")
+VOWEL_RE = re.compile(r"[aeiouyAEIOUY]")
+MIXED_CASE_RE = re.compile(r"[a-z][A-Z]")
+LETTER_RE = re.compile(r"[^\W\d_]")
+PAGE_NUMBER_RE = re.compile(r"^(?:page\s*)?#(?:\s*(?:of|/)\s*#)?$")
+# "Account Number: 0012...", "Statement Period: ..." carry document fields
+KEY_VALUE_RE = re.compile(r"^[^\W\d_][^:]{0,40}:\s*\S")
+SENTENCE_END = (".", "!", "?", ":", ";")
+ALLOWED_SYMBOLS = set(".,;:!?'\"()[]{}-/&%$€£₹@#*+=|<>_")
+
+
+def normalize_unicode(text):
+    text = unicodedata.normalize("NFKC", text)
+    text = INVISIBLE_RE.sub("", text)
+    return CONTROL_RE.sub(" ", text)
+
+
+def is_structured_line(line):
+    # Table rows, key/value pairs and list items keep their own line
+    return (
+        "|" in line
+        or "  " in line
+        or "\t" in line
+        or line[:1] in ("-", "*", "•")
+        or bool(re.match(r"^\(?\d+[.)]\s", line))
+    )
+
+
+def join_broken_lines(text):
+    lines = [line.rstrip() for line in text.split("\n")]
+    joined = []
+    for line in lines:
+        stripped = line.strip()
+        if (
+            joined
+            and stripped
+            and joined[-1].strip()
+            and stripped[0].islower()
+            and not joined[-1].rstrip().endswith(SENTENCE_END)
+            and not is_structured_line(joined[-1])
+            and not is_structured_line(line)
+        ):
+            joined[-1] = joined[-1].rstrip() + " " + stripped
+        else:
+            joined.append(line)
+    return "\n".join(joined)
+
+
+def normalize_text(text):
+    # De-hyphenation, broken-line joining and whitespace/Unicode normalization
+    text = normalize_unicode(text).replace("\r\n", "\n").replace("\r", "\n")
+    text = HYPHEN_BREAK_RE.sub(r"\1", text)
+    text = join_broken_lines(text)
+    # Runs of spaces in table-like lines separate columns, keep one gap
+    text = "\n".join(
+        COLUMN_GAP_RE.sub("  ", line).strip() if is_structured_line(line) else SPACES_RE.sub(" ", line).strip()
+        for line in text.split("\n")
+    )
+    return BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def line_signature(line):
+    # "Page 3 of 12" and "Page 4 of 12" are the same footer. Lines without
+    # letters (amounts, balances) are data, not headers: they get an empty
+    # signature and are never stripped, bare page numbers excepted. So are
+    # "key: value" lines, which only look repeated because digits are masked.
+    if KEY_VALUE_RE.match(line.strip()):
+        return ""
+    signature = DIGITS_RE.sub("#", line.strip().lower())
+    if LETTER_RE.search(signature) or PAGE_NUMBER_RE.match(signature.strip(" -–—|.")):
+        return signature
+    return ""
+
+
+def edge_indexes(lines):
+    # Positions of the top and bottom non-empty lines of a page
+    content = [index for index, line in enumerate(lines) if line.strip()]
+    count = HEADER_FOOTER_LINES if len(content) > 2 * HEADER_FOOTER_LINES + 1 else 1
+    return set(content[:count] + content[-count:])
+
+
+def edge_lines(text):
+    lines = text.split("\n")
+    return [lines[index] for index in sorted(edge_indexes(lines))]
+
+
+class PageNormalizer:
+    # Normalizes pages one at a time. The first `warmup` pages are buffered
+    # to learn which top/bottom lines repeat on most pages (running headers,
+    # footers, page numbers); the first occurrence of each is kept and the
+    # later ones are dropped.
+
+    def __init__(self, warmup=HEADER_FOOTER_WARMUP):
+        self.warmup = warmup
+        self.buffer = []
+        self.repeated = None
+        self.kept = set()
+
+    def learn(self):
+        counts = Counter()
+        for text in self.buffer:
+            counts.update({line_signature(line) for line in edge_lines(text)})
+        threshold = max(2, (len(self.buffer) + 1) // 2)
+        self.repeated = {sig for sig, count in counts.items() if count >= threshold and sig}
+
+    def strip(self, text):
+        # Only the edge occurrence goes, the same line inside the page stays
+        lines = text.split("\n")
+        drop = set()
+        for index in sorted(edge_indexes(lines)):
+            signature = line_signature(lines[index])
+            if signature not in self.repeated:
+                continue
+            if signature in self.kept:
+                drop.add(index)
+            else:
+                self.kept.add(signature)
+        kept = [line for index, line in enumerate(lines) if index not in drop]
+        if not any(line.strip() for line in kept):
+            kept = lines
+        return normalize_text("\n".join(kept))
+
+    def feed(self, text):
+        if self.repeated is not None:
+            return [self.strip(text)]
+        self.buffer.append(text)
+        if len(self.buffer) < self.warmup:
+            return []
+        return self.flush()
+
+    def flush(self):
+        if self.repeated is None:
+            self.learn()
+        pages = [self.strip(text) for text in self.buffer]
+        self.buffer = []
+        return pages
+
+
+def text_quality(text):
+    # 0..1 estimate of how clean the text already is. Born-digital text
+    # layers score high; OCR noise (stray symbols, broken or single-letter
+    # tokens) pulls it down.
+    chars = [ch for ch in text if not ch.isspace()]
+    if not chars:
+        return 1.0
+
+    garbage = sum(1 for ch in chars if not ch.isalnum() and ch not in ALLOWED_SYMBOLS) / len(chars)
+    garbage_score = 1.0 - min(garbage * 5, 1.0)
+
+    words = WORD_RE.findall(text)
+    if not words:
+        return garbage_score
+
+    def wordlike(word):
+        if MIXED_CASE_RE.search(word[1:]):
+            return False
+        if word.isascii():
+            if len(word) == 1:
+                return word.lower() in ("a", "i")
+            return bool(VOWEL_RE.search(word)) or word.isupper()
+        return True
+
+    wordlike_ratio = sum(1 for word in words if wordlike(word)) / len(words)
+    singles = sum(1 for word in words if len(word) == 1 and word.lower() not in ("a", "i")) / len(words)
+    single_score = 1.0 - min(singles * 3, 1.0)
+
+    return round(0.5 * wordlike_ratio + 0.3 * garbage_score + 0.2 * single_score, 3)
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from backend.document_parser import ocr_image_with_timings
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "30"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+        return _pool
+
+
+def shutdown_ocr_pool(pool=None):
+    # With `pool`, only that pool is shut down and only replaced if it is
+    # still the current one; a fresh pool other requests already submitted
+    # to is left alone
+    global _pool
+    with _pool_lock:
+        if pool is None:
+            pool = _pool
+        if pool is None:
+            return
+        if pool is _pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def submit_ocr(image_bytes, timeout=OCR_TIMEOUT):
+    pool = get_ocr_pool()
+    future = pool.submit(ocr_image_with_timings, image_bytes, timeout)
+    future.pool = pool
+    return future
+
+
+def ocr_result(future, wait):
+    # Returns {"text": ..., "timings": {...}}
+    try:
+        return future.result(timeout=max(wait, 0))
+    except TimeoutError:
+        future.cancel()
+        error = f"Timed out after {wait:g}s"
+    except BrokenProcessPool as e:
+        shutdown_ocr_pool(getattr(future, "pool", None))
+        error = str(e)
+    except Exception as e:
+        error = str(e)
+    return {"text": f"[OCR Image Error] {error}", "timings": {}}
+
+
+def ocr_images(images, timeout=OCR_TIMEOUT):
+    # OCR all images concurrently; results come back in the same order as images
+    if not images:
+        return []
+
+    futures = [submit_ocr(img, timeout) for img in images]
+    start = time.monotonic()
+    results = []
+
+    for index, future in enumerate(futures):
+        # tesseract itself is killed after `timeout`, this only guards against
+        # a worker that hangs before or after the tesseract call
+        deadline = start + timeout * (index // OCR_WORKERS + 1) + 5
+        results.append(ocr_result(future, deadline - time.monotonic()))
+    return results
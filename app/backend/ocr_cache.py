@@ -0,0 +1,31 @@
+import functools
+import hashlib
+import os
+import pytesseract
+from backend.disk_cache import DiskCache, CACHE_DIR
+
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", "50000"))
+
+ocr_cache = DiskCache(os.path.join(CACHE_DIR, "ocr.sqlite3"), max_entries=OCR_CACHE_MAX_ENTRIES)
+
+
+@functools.lru_cache(maxsize=1)
+def tesseract_version():
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return "unknown"
+
+
+def ocr_cache_key(image_bytes, lang, config):
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{digest}:{tesseract_version()}:{lang}:{config}"
+
+
+def get_cached_ocr(image_bytes, lang, config):
+    value = ocr_cache.get(ocr_cache_key(image_bytes, lang, config))
+    return value.decode("utf-8") if value is not None else None
+
+
+def set_cached_ocr(image_bytes, lang, config, text):
+    ocr_cache.set(ocr_cache_key(image_bytes, lang, config), text)
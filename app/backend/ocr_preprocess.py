@@ -0,0 +1,73 @@
+import io
+import os
+import cv2
+import numpy as np
+from PIL import Image
+
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "1") == "1"
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))
+OCR_MIN_SIDE = int(os.getenv("OCR_MIN_SIDE", "1000"))
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "3000"))
+MAX_DESKEW_ANGLE = 15.0
+
+# Part of the OCR cache key, output changes whenever these settings change
+PREPROCESS_SIGNATURE = f"pre={int(OCR_PREPROCESS)}:{OCR_TARGET_DPI}:{OCR_MIN_SIDE}:{OCR_MAX_SIDE}"
+
+
+def image_dpi(image_bytes):
+    # Only the header is read, pixels are decoded by OpenCV afterwards
+    try:
+        dpi = Image.open(io.BytesIO(image_bytes)).info.get("dpi")
+        return float(dpi[0]) if dpi and dpi[0] > 1 else None
+    except Exception:
+        return None
+
+
+def normalize_scale(image, dpi):
+    height, width = image.shape[:2]
+    scale = OCR_TARGET_DPI / dpi if dpi else 1.0
+
+    # Without reliable DPI metadata the long side is kept within a range
+    # tesseract handles well: huge photos are slow, thumbnails are unreadable
+    long_side = max(height, width) * scale
+    if long_side > OCR_MAX_SIDE:
+        scale = OCR_MAX_SIDE / max(height, width)
+    elif long_side < OCR_MIN_SIDE:
+        scale = OCR_MIN_SIDE / max(height, width)
+
+    if abs(scale - 1.0) < 0.05:
+        return image
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def deskew(binary):
+    # Angle of the minimum area rectangle around the dark (ink) pixels
+    coords = cv2.findNonZero(255 - binary)
+    if coords is None or len(coords) < 100:
+        return binary
+
+    angle = cv2.minAreaRect(coords)[-1]
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    if abs(angle) < 0.5 or abs(angle) > MAX_DESKEW_ANGLE:
+        return binary
+
+    height, width = binary.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(
+        binary, matrix, (width, height),
+        flags=cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT, borderValue=255,
+    )
+
+
+def preprocess_for_ocr(image_bytes):
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError("Could not decode image for OCR preprocessing")
+
+    image = normalize_scale(image, image_dpi(image_bytes))
+    image = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    return deskew(image)
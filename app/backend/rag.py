@@ -1,28 +1,45 @@
-import os
-from dotenv import load_dotenv
-
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.chains import RetrievalQA
 from langchain.schema import LLMResult
 from langchain.llms.base import LLM
-from typing import List, Optional
-import google.generativeai as genai
-from pydantic import PrivateAttr
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from typing import Any, List, Optional
+import os
+import numpy as np
+from backend.llm_cache import cached_generate
+from backend.embedding_service import embeddings
+from backend.index_registry import index_registry
+
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 120
+
+# Hybrid retrieval: chunks returned, candidates per retriever, and the
+# reciprocal rank fusion constant and weights
+RAG_K = int(os.getenv("RAG_K", "3"))
+RAG_FETCH_K = int(os.getenv("RAG_FETCH_K", "10"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+RAG_DENSE_WEIGHT = float(os.getenv("RAG_DENSE_WEIGHT", "1.0"))
+RAG_LEXICAL_WEIGHT = float(os.getenv("RAG_LEXICAL_WEIGHT", "1.0"))
+
+
+def get_embeddings():
+    # MiniLM is loaded once per process by the embedding service, which also
+    # batches concurrent requests
+    return embeddings
 
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+def split_document(document_text: str):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return splitter.split_text(document_text)
 
 
 class GeminiLLM(LLM):
     model_name: str = "gemini-1.5-flash"
     temperature: float = 0.2
-    _model: any = PrivateAttr()
 
     def __init__(self, model_name="gemini-1.5-flash", temperature=0.2, **kwargs):
         super().__init__(model_name=model_name, temperature=temperature, **kwargs)
-        self._model = genai.GenerativeModel(model_name)
 
     @property
     def _llm_type(self) -> str:
@@ -30,8 +47,7 @@ class GeminiLLM(LLM):
 
     def _call(self, prompt: str, stop: Optional[List[str]] = None, **kwargs) -> str:
         try:
-            response = self._model.generate_content(prompt)
-            return response.text.strip()
+            return cached_generate(self.model_name, prompt, {"temperature": self.temperature}).strip()
         except Exception as e:
             return f"(Gemini API error: {e})"
 
@@ -39,24 +55,58 @@ class GeminiLLM(LLM):
         generations = []
         for prompt in prompts:
             try:
-                response = self._model.generate_content(prompt)
-                generations.append([{"text": response.text.strip()}])
+                text = cached_generate(self.model_name, prompt, {"temperature": self.temperature})
+                generations.append([{"text": text.strip()}])
             except Exception as e:
                 generations.append([{"text": f"(Gemini API error: {e})"}])
         return LLMResult(generations=generations)
     
 
-def build_rag_chain(document_text: str):
-    # Step 1: Split document
-    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=120)
-    chunks = splitter.split_text(document_text)
+class HybridRetriever(BaseRetriever):
+    # FAISS (MiniLM) and BM25 results merged with reciprocal rank fusion.
+    # Questions naming an identifier that occurs verbatim in the document
+    # (invoice numbers, GSTINs, account numbers) are answered from the BM25
+    # index alone, without embedding the question.
+
+    document_index: Any
+    k: int = RAG_K
+    fetch_k: int = RAG_FETCH_K
+    rrf_k: int = RAG_RRF_K
+    dense_weight: float = RAG_DENSE_WEIGHT
+    lexical_weight: float = RAG_LEXICAL_WEIGHT
+
+    def document(self, position, retrieval, score):
+        return Document(
+            page_content=self.document_index.chunks[position],
+            metadata={"chunk": position, "retrieval": retrieval, "score": round(score, 4)},
+        )
+
+    def dense_search(self, query):
+        vector = np.asarray([self.document_index.embeddings.embed_query(query)], dtype=np.float32)
+        return self.document_index.search(vector[0], self.fetch_k)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        bm25 = self.document_index.bm25
+        if self.lexical_weight > 0 and bm25.id_terms(query):
+            hits = bm25.search(query, self.k)
+            return [self.document(position, "lexical", score) for position, score in hits]
+
+        scores = {}
+        if self.dense_weight > 0:
+            for rank, position in enumerate(self.dense_search(query)):
+                scores[position] = scores.get(position, 0.0) + self.dense_weight / (self.rrf_k + rank + 1)
+        if self.lexical_weight > 0:
+            for rank, (position, _) in enumerate(bm25.search(query, self.fetch_k)):
+                scores[position] = scores.get(position, 0.0) + self.lexical_weight / (self.rrf_k + rank + 1)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:self.k]
+        return [self.document(position, "hybrid", score) for position, score in ranked]
 
-    if not chunks:
-        raise ValueError("Document could not be split into chunks.")
 
-    # Step 2: Embed chunks with Hugging Face
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vectorstore = FAISS.from_texts(chunks, embedding=embeddings)
+def build_rag_chain(document_text: str, k: int = RAG_K, dense_weight: float = RAG_DENSE_WEIGHT, lexical_weight: float = RAG_LEXICAL_WEIGHT):
+    # Step 1 and 2: Split and index the document (dense and BM25), or reuse
+    # its saved index
+    document_index = index_registry.get(document_text, split_document, get_embeddings())
 
     # Step 3: Use Gemini Pro LLM
     llm = GeminiLLM(temperature=0.2)
@@ -64,7 +114,13 @@ def build_rag_chain(document_text: str):
     # Step 4: Build retrieval-based QA chain
     qa_chain = RetrievalQA.from_chain_type(
         llm=llm,
-        retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
+        retriever=HybridRetriever(
+            document_index=document_index,
+            k=k,
+            fetch_k=max(RAG_FETCH_K, k),
+            dense_weight=dense_weight,
+            lexical_weight=lexical_weight,
+        ),
         return_source_documents=True
     )
 
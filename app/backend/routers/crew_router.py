@@ -1,12 +1,19 @@
+from typing import Literal, Optional
 from fastapi import APIRouter
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from backend.services.crew_service import run_crew
 
 router = APIRouter()
 
 class CrewInput(BaseModel):
     text: str
+    # "fused" sends the document once in a single structured-output call
+    mode: Literal["agents", "fused"] = "agents"
+    # Ignore the stored rule set for this document type and suggest a new one
+    refresh_rules: bool = False
+    # Token budget for the field and table tasks, None sends the whole document
+    context_budget: Optional[int] = Field(None, gt=0)
 
 @router.post("/")
 def run_crew_pipeline(input_data: CrewInput):
-    return run_crew(input_data.text)
+    return run_crew(input_data.text, input_data.mode, input_data.refresh_rules, input_data.context_budget)
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from backend.database import insert_document
+from backend.corpus_index import corpus_index
 
 router = APIRouter()
 
@@ -25,9 +26,15 @@ class StorePayload(BaseModel):
     failed_fields: Optional[List[str]] = None
 
 @router.post("/")
-def store_document(payload: StorePayload):
+def store_document(payload: StorePayload, background_tasks: BackgroundTasks):
     try:
-        inserted_id = insert_document(payload.dict())
+        document = payload.dict()
+        inserted_id = insert_document(document)
+        # Searchable shortly after the response, embedding is not on the request path
+        background_tasks.add_task(
+            corpus_index.add_document, inserted_id, payload.clean_content or payload.content,
+            payload.user_id, payload.type, document["created_at"],
+        )
         return {"success": True, "inserted_id": inserted_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,5 +1,7 @@
+from typing import Optional
 from fastapi import APIRouter, File, UploadFile
-from backend.services.document_service import process_document
+from backend.services.document_service import process_document_cached, parse_cache
+from backend.ocr_cache import ocr_cache
 from fastapi.responses import JSONResponse
 
 router = APIRouter()
@@ -8,7 +10,27 @@ router = APIRouter()
 async def upload_document(file: UploadFile = File(...)):
     try:
         content = await file.read()
-        result = process_document(content, file.filename)
+        result = process_document_cached(content, file.filename)
         return result
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.get("/cache")
+def cache_info(entries: bool = False):
+    info = parse_cache.stats()
+    if entries:
+        info["items"] = parse_cache.entries()
+    return info
+
+@router.delete("/cache")
+def purge_cache(key: Optional[str] = None):
+    removed = parse_cache.delete(key) if key else parse_cache.clear()
+    return {"removed": removed}
+
+@router.get("/ocr-cache")
+def ocr_cache_info():
+    return ocr_cache.stats()
+
+@router.delete("/ocr-cache")
+def purge_ocr_cache():
+    return {"removed": ocr_cache.clear()}
@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from backend.llm_cache import llm_cache
+from backend.llm_gateway import gateway
+
+router = APIRouter()
+
+@router.get("/cache")
+def cache_info():
+    return llm_cache.stats()
+
+@router.delete("/cache")
+def purge_cache():
+    return {"removed": llm_cache.clear()}
+
+@router.get("/stats")
+def gateway_stats():
+    return gateway.stats()
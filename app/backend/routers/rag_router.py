@@ -1,22 +1,34 @@
+from typing import Optional
 from fastapi import APIRouter
-from pydantic import BaseModel
-from backend.services.rag_service import build_rag_chain_cached
+from pydantic import BaseModel, Field
+from backend.services.rag_service import answer_question
+from backend.embedding_service import embedding_service
+from backend.index_registry import index_registry
 
 router = APIRouter()
 
-qa_chain = None  # Stored across questions
-
 class QAInput(BaseModel):
     document_text: str
     question: str
+    # Retrieval overrides, defaults come from RAG_K / RAG_*_WEIGHT
+    k: Optional[int] = Field(None, gt=0, le=50)
+    dense_weight: Optional[float] = Field(None, ge=0)
+    lexical_weight: Optional[float] = Field(None, ge=0)
 
 @router.post("/")
 def ask_question(input_data: QAInput):
-    global qa_chain
-    if not qa_chain:
-        qa_chain = build_rag_chain_cached(input_data.document_text)
-    result = qa_chain(input_data.question)
-    return {
-        "answer": result["result"],
-        "context": [doc.page_content for doc in result["source_documents"]]
-    }
+    retrieval = input_data.dict(include={"k", "dense_weight", "lexical_weight"}, exclude_none=True)
+    return answer_question(input_data.document_text, input_data.question, **retrieval)
+
+@router.get("/embeddings")
+def embedding_stats():
+    return embedding_service.stats()
+
+@router.get("/indexes")
+def index_stats():
+    return index_registry.stats()
+
+@router.delete("/indexes")
+def unload_indexes(key: str = None):
+    # Only drops indexes from memory, the saved copies stay on disk
+    return {"unloaded": index_registry.evict(key)}
@@ -0,0 +1,48 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from backend.corpus_index import corpus_index
+from backend.database import get_all_documents
+
+router = APIRouter()
+
+class SearchQuery(BaseModel):
+    query: str
+    k: int = Field(10, gt=0, le=100)
+    user_id: Optional[str] = None
+    type: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+@router.post("/")
+def search(query: SearchQuery):
+    return corpus_index.search(
+        query.query,
+        query.k,
+        user_id=query.user_id,
+        doc_type=query.type,
+        created_after=query.created_after,
+        created_before=query.created_before,
+    )
+
+@router.get("/stats")
+def search_stats():
+    return corpus_index.stats()
+
+@router.post("/reindex")
+def reindex():
+    # Adds stored documents that are not in the corpus index yet
+    try:
+        added = 0
+        for doc in get_all_documents():
+            if not corpus_index.has_document(doc["_id"]):
+                corpus_index.add_document(
+                    doc["_id"], doc.get("clean_content") or doc.get("content"),
+                    doc.get("user_id"), doc.get("type"), doc.get("created_at"),
+                )
+                added += 1
+        corpus_index.save()
+        return {"added": added}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
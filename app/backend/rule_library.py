@@ -0,0 +1,80 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pymongo.errors import PyMongoError
+from backend.database import get_rule_set, save_rule_set
+
+RULE_LIBRARY_TTL_DAYS = float(os.getenv("RULE_LIBRARY_TTL_DAYS", "30"))
+# After a failed lookup the library is skipped for this long, so requests
+# don't each wait for the Mongo timeout while it is down
+RULE_LIBRARY_RETRY_AFTER = float(os.getenv("RULE_LIBRARY_RETRY_AFTER", "30"))
+
+# Writes happen off the request path, one at a time
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rule-library")
+_state = {"down_until": 0.0}
+_state_lock = threading.Lock()
+
+# Same list the classifier task is asked to choose from
+DOCUMENT_TYPES = [
+    "Invoice", "Receipt", "Bank Statement", "Payslip", "Legal agreements", "Resumes/CVs",
+    "Research papers", "Compliance forms", "Business proposals", "Insurance policies", "Meeting minutes",
+]
+
+
+def slug(text):
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def rule_set_key(doc_type):
+    # The classifier answers in free text ("Invoice", "This is an invoice."),
+    # map it onto one of the known types so all invoices share a rule set
+    text = slug(doc_type)
+    for known in DOCUMENT_TYPES:
+        if slug(known) in text:
+            return slug(known)
+    return text[:100] or "other"
+
+
+def mark_down():
+    with _state_lock:
+        _state["down_until"] = time.monotonic() + RULE_LIBRARY_RETRY_AFTER
+
+
+def is_down():
+    with _state_lock:
+        return time.monotonic() < _state["down_until"]
+
+
+def lookup_rules(doc_type):
+    # Stored rules for this type, or None when unseen, stale or Mongo is down
+    if is_down():
+        return None
+    try:
+        entry = get_rule_set(rule_set_key(doc_type))
+    except PyMongoError as e:
+        print(f"[Rule library] lookup failed: {e}")
+        mark_down()
+        return None
+    if not entry or not entry.get("rules"):
+        return None
+    if RULE_LIBRARY_TTL_DAYS and datetime.utcnow() - entry["updated_at"] > timedelta(days=RULE_LIBRARY_TTL_DAYS):
+        return None
+    return entry["rules"]
+
+
+def _save(doc_type, rules):
+    try:
+        save_rule_set(rule_set_key(doc_type), rules, label=doc_type.strip())
+    except PyMongoError as e:
+        print(f"[Rule library] store failed: {e}")
+        mark_down()
+
+
+def store_rules(doc_type, rules):
+    # Returns the Future of the background write, or None when nothing is stored
+    if not rules or not isinstance(rules, (list, dict)) or is_down():
+        return None
+    return _writer.submit(_save, doc_type, rules)
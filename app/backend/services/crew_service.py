@@ -1,4 +1,7 @@
 from backend.agents.crew import run_crew_pipeline
+from backend.agents.fused import run_fused_pipeline
 
-def run_crew(text: str):
-    return run_crew_pipeline(text)
+def run_crew(text: str, mode: str = "agents", refresh_rules: bool = False, context_budget: int = None):
+    if mode == "fused":
+        return run_fused_pipeline(text)
+    return run_crew_pipeline(text, refresh_rules=refresh_rules, context_budget=context_budget)
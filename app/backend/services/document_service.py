@@ -1,82 +1,202 @@
 import os
-import tempfile
-from backend.document_parser import file_preprocess, extract_images_from_pdf, extract_text_from_image
-from backend.cleaner import clean_text_with_gemini, clean_ocr_text_with_gemini
+import json
+import hashlib
+from collections import deque
+from backend.document_parser import file_preprocess, route_pdf_pages, iter_docx_pages, dedupe_images
+from backend.ocr import ocr_images, submit_ocr, ocr_result, OCR_TIMEOUT, OCR_WORKERS
+from backend.image_filter import filter_images, SKIP, DOWNGRADE
+from backend.cleaner import clean_ocr_texts_with_gemini, ChunkedCleaner, CLEANER_VERSION
+from backend.disk_cache import DiskCache, CACHE_DIR
+from backend.normalizer import PageNormalizer, text_quality
 import base64
-from io import BytesIO
 
-def convert_to_pdf(file, extension):
-    try:
-        if extension == "docx":
-            import win32com.client as win32
+# Bump when extraction changes so cached parse results are not reused
+PARSER_VERSION = "8"
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
 
-            # Save to temp file if input is bytes
-            if isinstance(file, bytes):
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as temp_docx:
-                    temp_docx.write(file)
-                    temp_docx_path = temp_docx.name
-            else:
-                temp_docx_path = file
+# Rasterized pages waiting in the OCR pool; past this, routing waits for the
+# oldest page so a long scanned PDF is not held in memory all at once
+OCR_MAX_IN_FLIGHT = int(os.getenv("OCR_MAX_IN_FLIGHT", str(2 * OCR_WORKERS)))
 
-            # Convert using MS Word
-            word = win32.Dispatch("Word.Application")
-            doc = word.Documents.Open(temp_docx_path)
-            pdf_path = temp_docx_path.replace(".docx", ".pdf")
-            doc.SaveAs(pdf_path, FileFormat=17)  # 17 = wdFormatPDF
-            doc.Close()
-            word.Quit()
+parse_cache = DiskCache(os.path.join(CACHE_DIR, "parse.sqlite3"), max_bytes=PARSE_CACHE_MAX_BYTES)
 
-            with open(pdf_path, "rb") as f:
-                pdf_bytes = f.read()
 
-            # Clean up temp files
-            os.remove(temp_docx_path)
-            os.remove(pdf_path)
+def is_ocr_error(ocr_text):
+    return ocr_text.startswith("[OCR Image Error]")
 
-            return pdf_bytes
 
-    except Exception as e:
-        return f"Error converting {extension} to PDF: {e}"
+def has_text(ocr_text, min_chars=3):
+    if is_ocr_error(ocr_text):
+        return False
+    return sum(ch.isalnum() for ch in ocr_text) >= min_chars
+
+
+def iter_routed_pdf_pages(file_bytes, images, page_timings, page_errors=None):
+    # Rasterized pages are OCR'd in the pool while routing moves on to the
+    # next page; pages are still yielded in order. Pages whose OCR failed are
+    # yielded empty, with the error in page_errors.
+    pending = deque()
+    in_flight = 0
+
+    def resolve(page_number, route, payload):
+        if route == "ocr":
+            result = ocr_result(payload, OCR_TIMEOUT + 5)
+            payload = result["text"]
+            if is_ocr_error(payload):
+                print(f"[Page {page_number} OCR error]: {payload}")
+                if page_errors is not None:
+                    page_errors[page_number] = payload
+                payload = ""
+            page_timings[page_number] = result["timings"]
+        return page_number, payload, route
+
+    for page_number, route, payload in route_pdf_pages(file_bytes, images):
+        if route == "ocr":
+            payload = submit_ocr(payload)
+            in_flight += 1
+        pending.append((page_number, route, payload))
+        while pending and (pending[0][1] == "text" or pending[0][2].done() or in_flight >= OCR_MAX_IN_FLIGHT):
+            page = pending.popleft()
+            if page[1] == "ocr":
+                in_flight -= 1
+            yield resolve(*page)
+
+    while pending:
+        yield resolve(*pending.popleft())
+
+
+def stream_text(page_iter):
+    # Cleaning of each chunk of pages starts as soon as the chunk is full
+    # instead of waiting for the last page of the document. Pages are
+    # normalized locally first; only low quality chunks (usually OCR) are
+    # escalated to Gemini.
+    pages = []
+    normalizer = PageNormalizer()
+    cleaner = ChunkedCleaner()
+    for page_number, text, route in page_iter:
+        pages.append({"page": page_number, "text": text, "route": route, "quality": text_quality(text)})
+        for normalized in normalizer.feed(text):
+            cleaner.add(normalized)
+    for normalized in normalizer.flush():
+        cleaner.add(normalized)
+    cleaned_text, clean_report = cleaner.finish()
+
+    extracted_text = "\n".join(page["text"] for page in pages if page["text"]) or "No text found."
+    if cleaned_text is None:
+        # Nothing to clean, "No text found." is passed through as-is
+        cleaned_text = extracted_text
+    return pages, extracted_text, cleaned_text, clean_report
 
 
 def process_document(file_bytes, filename):
     ext = filename.split(".")[-1].lower()
-    if ext == "docx":
-        file_bytes = convert_to_pdf(file_bytes, ext)
-        ext = "pdf"
-    extracted_text = file_preprocess(file_bytes, ext)
-    cleaned_text = clean_text_with_gemini(extracted_text)
-
-    images = extract_images_from_pdf(file_bytes) if ext == "pdf" else []
-    img_ocr = []
-    img_corrected = []
-
-    images_b64 = []  # Will hold base64 encoded strings of images
-
-    for img in images:
-        # Convert img (PIL Image or raw bytes) to base64 string
-        if hasattr(img, "save"):  # likely a PIL Image
-            buffered = BytesIO()
-            img.save(buffered, format="PNG")  # or JPEG if appropriate
-            img_bytes = buffered.getvalue()
+    pages = []
+    images = []
+    if ext == "pdf":
+        page_timings = {}
+        page_errors = {}
+        pages, extracted_text, cleaned_text, clean_report = stream_text(
+            iter_routed_pdf_pages(file_bytes, images, page_timings, page_errors)
+        )
+        for page in pages:
+            if page["page"] in page_timings:
+                page["ocr_timings"] = page_timings[page["page"]]
+            if page["page"] in page_errors:
+                page["ocr_error"] = page_errors[page["page"]]
+    elif ext == "docx":
+        pages, extracted_text, cleaned_text, clean_report = stream_text(iter_docx_pages(file_bytes, images))
+    else:
+        extracted_text = file_preprocess(file_bytes, ext)
+        _, _, cleaned_text, clean_report = stream_text([(1, extracted_text, "text")])
+
+    # Each distinct image is OCR'd and cleaned once, repeats (logos, stamps)
+    # reuse the result of their first occurrence
+    unique_images, positions = dedupe_images(images)
+
+    # Bullets, rules, icons and blank backgrounds never reach OCR or Gemini
+    decisions, filter_report = filter_images(unique_images)
+    to_ocr = [i for i, (decision, _) in enumerate(decisions) if decision != SKIP]
+    ocr_results = ocr_images([unique_images[i] for i in to_ocr])
+
+    unique_ocr = [""] * len(unique_images)
+    unique_timings = [{}] * len(unique_images)
+    unique_corrected = [""] * len(unique_images)
+    to_correct = []
+    for i, result in zip(to_ocr, ocr_results):
+        ocr_text = result["text"]
+        unique_ocr[i] = ocr_text
+        unique_timings[i] = result["timings"]
+        if decisions[i][0] == DOWNGRADE and not has_text(ocr_text):
+            unique_corrected[i] = ocr_text
         else:
-            img_bytes = img  # already bytes?
+            to_correct.append(i)
 
-        img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-        images_b64.append(img_b64)
+    corrected, correction_report = clean_ocr_texts_with_gemini(
+        [(unique_ocr[i], unique_images[i]) for i in to_correct]
+    )
+    for i, text in zip(to_correct, corrected):
+        unique_corrected[i] = text
 
-        ocr_text = extract_text_from_image(img)
-        cleaned = clean_ocr_text_with_gemini(ocr_text, img)
-        img_ocr.append(ocr_text)
-        img_corrected.append(cleaned)
+    unique_b64 = [base64.b64encode(img).decode("utf-8") for img in unique_images]
+
+    images_b64 = [unique_b64[pos] for pos in positions]  # base64 encoded strings of images
+    img_ocr = [unique_ocr[pos] for pos in positions]
+    img_ocr_timings = [unique_timings[pos] for pos in positions]
+    img_corrected = [unique_corrected[pos] for pos in positions]
 
     return {
         "extracted_text": extracted_text,
         "cleaned_text": cleaned_text,
+        "pages": pages,
+        "cleaning": clean_report,
         "images": images_b64,  # <-- base64 encoded strings!
         "img_ocr": img_ocr,
+        "img_ocr_timings": img_ocr_timings,
         "img_correct_ocr": img_corrected,
+        "duplicate_images": len(images) - len(unique_images),
+        "image_filter": filter_report,
+        "ocr_correction": correction_report,
+        "ocr_errors": {
+            "pages": sum(1 for page in pages if "ocr_error" in page),
+            "images": sum(1 for i in to_ocr if is_ocr_error(unique_ocr[i])),
+        },
         "extension": ext,
         "filename": filename,
         "file_bytes": base64.b64encode(file_bytes).decode("utf-8") 
     }
+
+
+def parse_cache_key(file_bytes, ext):
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    return f"{digest}:{ext}:{PARSER_VERSION}:{CLEANER_VERSION}"
+
+
+def is_cacheable(result):
+    # Results with OCR or Gemini failures in them should be retried, not replayed
+    return (
+        not result["cleaning"].get("failed")
+        and not result["ocr_correction"].get("failed")
+        and not any(result["ocr_errors"].values())
+    )
+
+
+def process_document_cached(file_bytes, filename):
+    ext = filename.split(".")[-1].lower()
+    key = parse_cache_key(file_bytes, ext)
+
+    cached = parse_cache.get(key)
+    if cached is not None:
+        result = json.loads(cached)
+        result["filename"] = filename
+        result["file_bytes"] = base64.b64encode(file_bytes).decode("utf-8")
+        result["cached"] = True
+        return result
+
+    result = process_document(file_bytes, filename)
+    if is_cacheable(result):
+        # file_bytes is the upload itself, no need to store it twice
+        stored = {k: v for k, v in result.items() if k != "file_bytes"}
+        parse_cache.set(key, json.dumps(stored))
+    result["cached"] = False
+    return result
+
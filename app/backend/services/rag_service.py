@@ -1,8 +1,16 @@
 from backend.rag import build_rag_chain
+from backend.index_registry import document_hash, index_key
 
-rag_cache = {}
-
-def build_rag_chain_cached(text: str):
-    if text not in rag_cache:
-        rag_cache[text] = build_rag_chain(text)
-    return rag_cache[text]
+def answer_question(text: str, question: str, **retrieval):
+    # The chain is cheap to build, the document index behind it comes from
+    # the shared registry. retrieval: k, dense_weight, lexical_weight
+    result = build_rag_chain(text, **retrieval)(question)
+    sources = result["source_documents"]
+    return {
+        "answer": result["result"],
+        "context": [doc.page_content for doc in sources],
+        "retrieval": sources[0].metadata.get("retrieval") if sources else None,
+        "document_hash": document_hash(text),
+        # Key for DELETE /rag/indexes
+        "index_key": index_key(text),
+    }
@@ -1,15 +1,18 @@
 import json
-import google.generativeai as genai
-from dotenv import load_dotenv
-import os
 import re
+from backend.llm_cache import cached_generate
+from backend.agents.rule_engine import evaluate_rules, merge_llm_results, text_fields, validation_report
 
-load_dotenv()
-
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel("gemini-1.5-flash")
+MODEL_NAME = "gemini-1.5-flash"
 
 def validate_document(input):
+    # Rules in the checker's rule language are evaluated locally against the
+    # "key: value" lines of the text, the model only sees the ones that can't
+    # be compiled or name an ambiguous field
+    results, pending = evaluate_rules(input.rules, text_fields(input.text), input.text)
+    if not pending:
+        return validation_report(results)
+
     prompt = f"""
     You are a strict document validator. The following text is from a document:
 
@@ -18,7 +21,7 @@ def validate_document(input):
     ---
 
     The user wants to validate it with the following rules:
-    {input.rules}
+    {pending}
 
     Go through each rule and check if it is satisfied in the document.
     Return a JSON like this:
@@ -36,14 +39,13 @@ def validate_document(input):
     Only return raw JSON. Do not include explanations or wrap in code block.
     """
 
-    response = model.generate_content(prompt)
-    result_text = response.text.strip()
+    result_text = cached_generate(MODEL_NAME, prompt).strip()
 
     result_text = re.sub(r"^```(?:json)?\n", "", result_text)
     result_text = re.sub(r"\n```$", "", result_text)
 
     try:
-        return json.loads(result_text)
+        return validation_report(merge_llm_results(results, pending, json.loads(result_text)))
     except Exception as e:
         return {
             "error": "Could not parse model response as JSON.",
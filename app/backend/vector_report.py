@@ -0,0 +1,118 @@
+"""Recall / latency / memory of the RAG vector storage options.
+
+    python -m backend.vector_report --corpus              # chunks from the corpus index
+    python -m backend.vector_report --files a.txt b.txt   # chunks of text files
+
+Every storage option (flat, sq8, pq, with and without exact re-rank) is
+measured against the exact flat index on the same vectors. A sample of the
+chunks is held out of the indexes and used as queries.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+import faiss
+import numpy as np
+from backend import vector_store
+
+
+def recall_at_k(found, truth, k):
+    return float(np.mean([len(set(f[:k]) & set(t[:k])) / k for f, t in zip(found, truth)]))
+
+
+def measure(index, queries, k, vectors=None, rerank_factor=vector_store.RAG_RERANK_FACTOR):
+    found = []
+    start = time.perf_counter()
+    for query in queries:
+        ids, _ = vector_store.search(index, query, k, vectors, rerank_factor)
+        found.append(list(ids))
+    latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return found, latency_ms
+
+
+def compare_storage(vectors, queries, k=10, rerank_factor=vector_store.RAG_RERANK_FACTOR):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    flat = vector_store.build_index(vectors, "flat")
+    truth, flat_ms = measure(flat, queries, k)
+    rows = [{
+        "storage": "flat", "rerank": False, "recall@k": 1.0,
+        "latency_ms": round(flat_ms, 3), "bytes": vector_store.index_bytes(flat),
+    }]
+
+    for storage in ("sq8", "pq"):
+        start = time.perf_counter()
+        index = vector_store.build_index(vectors, storage)
+        build_ms = (time.perf_counter() - start) * 1000
+        kind = type(faiss.downcast_index(index)).__name__
+        for rerank in (False, True):
+            found, latency_ms = measure(index, queries, k, vectors if rerank else None, rerank_factor)
+            rows.append({
+                "storage": storage,
+                "index": kind,
+                "rerank": rerank,
+                "recall@k": round(recall_at_k(found, truth, k), 4),
+                "latency_ms": round(latency_ms, 3),
+                # The re-rank reads the float32 vectors from disk, not RAM
+                "bytes": vector_store.index_bytes(index),
+                "build_ms": round(build_ms, 1),
+            })
+    for row in rows:
+        row["compression"] = round(rows[0]["bytes"] / row["bytes"], 1) if row["bytes"] else None
+    return rows
+
+
+def corpus_texts(limit):
+    from backend.corpus_index import CORPUS_DIR
+
+    db = sqlite3.connect(os.path.join(CORPUS_DIR, "chunks.sqlite3"))
+    return [row[0] for row in db.execute("SELECT text FROM chunks ORDER BY RANDOM() LIMIT ?", (limit,))]
+
+
+def file_texts(paths):
+    from backend.rag import split_document
+
+    chunks = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            chunks.extend(split_document(f.read()))
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--corpus", action="store_true", help="sample chunks from the corpus index")
+    source.add_argument("--files", nargs="+", help="text files to split into chunks")
+    parser.add_argument("--limit", type=int, default=20000, help="max chunks sampled from the corpus")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--rerank-factor", type=int, default=vector_store.RAG_RERANK_FACTOR)
+    args = parser.parse_args()
+
+    from backend.embedding_service import embedding_service
+
+    texts = corpus_texts(args.limit) if args.corpus else file_texts(args.files)
+    query_count = min(args.queries, len(texts) // 2)
+    if len(texts) - query_count <= args.k:
+        parser.error(f"Need more than k={args.k} chunks besides the queries, got {len(texts)} chunks")
+
+    embedding_service.start()
+    vectors = np.asarray(embedding_service.embed(texts), dtype=np.float32)
+    # Queries are not in the index, a query never finds itself
+    held_out = np.zeros(len(vectors), dtype=bool)
+    held_out[np.random.default_rng(0).choice(len(vectors), query_count, replace=False)] = True
+    queries, vectors = vectors[held_out], vectors[~held_out]
+
+    report = {
+        "chunks": len(vectors),
+        "dim": vectors.shape[1],
+        "queries": len(queries),
+        "k": args.k,
+        "results": compare_storage(vectors, queries, args.k, args.rerank_factor),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import os
+import faiss
+import numpy as np
+
+# How RAG chunk vectors are stored: "flat" (float32, exact), "sq8" (int8
+# scalar quantization, 4x smaller) or "pq" (product quantization, RAG_PQ_M
+# bytes per vector)
+RAG_VECTOR_STORAGE = os.getenv("RAG_VECTOR_STORAGE", "flat")
+RAG_PQ_M = int(os.getenv("RAG_PQ_M", "48"))
+# Quantized searches fetch k * RAG_RERANK_FACTOR candidates and re-rank them
+# with the exact float32 vectors, which stay on disk (memory-mapped)
+RAG_RERANK = os.getenv("RAG_RERANK", "1") == "1"
+RAG_RERANK_FACTOR = int(os.getenv("RAG_RERANK_FACTOR", "4"))
+
+STORAGES = ("flat", "sq8", "pq")
+# PQ with 8-bit codes needs at least one training vector per centroid
+PQ_MIN_TRAIN = 256
+
+
+def pq_subquantizers(dim, m):
+    # Largest sub-quantizer count <= m that divides the dimension
+    return next(count for count in range(min(m, dim), 0, -1) if dim % count == 0)
+
+
+def build_index(vectors, storage=RAG_VECTOR_STORAGE, metric=faiss.METRIC_L2):
+    # Index over `vectors` (float32, n x d), trained on them when quantized.
+    # Too few vectors for PQ falls back to SQ8.
+    if storage not in STORAGES:
+        raise ValueError(f"Unknown vector storage '{storage}', expected one of {STORAGES}")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dim = vectors.shape[1]
+
+    if storage == "pq" and len(vectors) < PQ_MIN_TRAIN:
+        storage = "sq8"
+    if storage == "flat":
+        index = faiss.IndexFlat(dim, metric)
+    elif storage == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, metric)
+    else:
+        index = faiss.IndexPQ(dim, pq_subquantizers(dim, RAG_PQ_M), 8, metric)
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def is_quantized(index):
+    return not isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+
+
+def index_bytes(index):
+    # Bytes held per stored vector times vectors, training data excluded
+    try:
+        return index.sa_code_size() * index.ntotal
+    except RuntimeError:
+        return index.d * 4 * index.ntotal
+
+
+def exact_scores(query, vectors, metric):
+    # Lower is better, like the L2 distances FAISS returns
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        return -(vectors @ query)
+    return ((vectors - query) ** 2).sum(axis=1)
+
+
+def search(index, query, k, vectors=None, rerank_factor=RAG_RERANK_FACTOR):
+    # query is one float32 vector. With `vectors` (the exact float32 rows,
+    # usually a memmap) a quantized index is over-fetched and re-ranked.
+    # Returns (ids, scores) best first, scores as reported by FAISS.
+    query = np.ascontiguousarray(query, dtype=np.float32).reshape(1, -1)
+    rerank = vectors is not None and rerank_factor > 1 and is_quantized(index)
+    fetch = min(k * rerank_factor if rerank else k, index.ntotal)
+    if fetch <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    scores, ids = index.search(query, fetch)
+    ids, scores = ids[0], scores[0]
+    keep = ids >= 0
+    ids, scores = ids[keep], scores[keep]
+    if not rerank:
+        return ids, scores
+
+    exact = exact_scores(query[0], np.asarray(vectors[np.sort(ids)]), index.metric_type)
+    order = np.argsort(exact)[:k]
+    ids = np.sort(ids)[order]
+    exact = exact[order]
+    return ids, (-exact if index.metric_type == faiss.METRIC_INNER_PRODUCT else exact)
@@ -0,0 +1,6 @@
+# Makes `backend` importable when running pytest from app/
+import os
+import tempfile
+
+# Keep the LLM/parse caches of a test run out of the working directory
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="docai-test-cache-"))
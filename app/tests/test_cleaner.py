@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+from backend.cleaner import ChunkedCleaner
+from backend.llm_gateway import LLMGateway
+
+
+class CleaningBackend:
+    # "Cleans" a chunk by upper-casing it. Earlier chunks answer slower so
+    # they complete out of order; chunks containing a word in `fail` raise
+    # the listed number of times first.
+
+    def __init__(self, fail=None):
+        self.fail = dict(fail or {})
+        self.calls = []
+        self.lock = threading.Lock()
+
+    async def generate(self, model_name, parts, generation_config=None, system_instruction=None):
+        chunk = parts[0].split("Extracted text:", 1)[1].strip()
+        with self.lock:
+            self.calls.append(chunk)
+            word = next((word for word, left in self.fail.items() if left and word in chunk), None)
+            if word:
+                self.fail[word] -= 1
+        await asyncio.sleep(0.05 / len(self.calls))
+        if word:
+            raise ValueError(f"bad response for {word}")
+        return chunk.upper(), {"prompt_tokens": 1, "output_tokens": 1}
+
+
+def cleaner(backend, **options):
+    return ChunkedCleaner(gateway=LLMGateway(backend=backend), max_chars=20, min_quality=None, **options)
+
+
+def test_chunks_keep_page_order():
+    pages = [f"ordering page {i} text" for i in range(6)]
+    chunked = cleaner(CleaningBackend(), concurrency=6)
+    for page in pages:
+        chunked.add(page)
+    text, report = chunked.finish()
+
+    assert text == "\n".join(page.upper() for page in pages)
+    assert report["chunks"] == 6
+    assert report["llm_chunks"] == 6
+    assert report["failed"] == 0
+
+
+def test_failed_chunk_is_retried_alone():
+    backend = CleaningBackend(fail={"flaky": 1})
+    chunked = cleaner(backend, retries=2)
+    for page in ("retry page one", "retry flaky two", "retry page three"):
+        chunked.add(page)
+    text, report = chunked.finish()
+
+    assert text == "RETRY PAGE ONE\nRETRY FLAKY TWO\nRETRY PAGE THREE"
+    assert report["retried"] == 1
+    assert report["failed"] == 0
+    assert sorted(backend.calls) == sorted(["retry page one", "retry flaky two", "retry flaky two", "retry page three"])
+
+
+def test_chunk_that_keeps_failing_keeps_raw_text():
+    chunked = cleaner(CleaningBackend(fail={"broken": 5}), retries=1)
+    for page in ("kept page one", "kept broken two"):
+        chunked.add(page)
+    text, report = chunked.finish()
+
+    assert text == "KEPT PAGE ONE\nkept broken two"
+    assert report["failed"] == 1
+    assert "bad response for broken" in report["errors"][0]
@@ -0,0 +1,75 @@
+import hashlib
+
+import numpy as np
+
+from backend.corpus_index import CorpusIndex
+
+
+def fake_embed(texts):
+    # Deterministic 16-dimensional vectors per text
+    return [np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:16], dtype=np.uint8) - 127.5 for text in texts]
+
+
+def documents(result):
+    return {hit["document_id"] for hit in result["results"]}
+
+
+def test_workers_see_each_others_documents(tmp_path):
+    first = CorpusIndex(str(tmp_path), embed=fake_embed)
+    second = CorpusIndex(str(tmp_path), embed=fake_embed)
+    first.load()
+    second.load()
+
+    first.add_document("a", "alpha invoice from the first worker")
+    second.add_document("b", "beta receipt from the second worker")
+
+    assert documents(first.search("beta receipt", k=5)) == {"a", "b"}
+    assert documents(second.search("alpha invoice", k=5)) == {"a", "b"}
+
+
+def test_rows_missing_from_the_saved_index_are_added_on_load(tmp_path):
+    embedded = []
+
+    def counting_embed(texts):
+        embedded.extend(texts)
+        return fake_embed(texts)
+
+    first = CorpusIndex(str(tmp_path), embed=fake_embed)
+    second = CorpusIndex(str(tmp_path), embed=fake_embed)
+    first.load()
+    second.load()
+    first.add_document("a", "alpha invoice from the first worker")
+    second.add_document("b", "beta receipt from the second worker")
+    second.save()
+    # Saved last, without ever having seen document "b"
+    first.save()
+
+    restarted = CorpusIndex(str(tmp_path), embed=counting_embed)
+    restarted.load()
+    assert restarted.index.ntotal == 2
+    # Stored vectors are reused, nothing is re-embedded
+    assert embedded == []
+    assert documents(restarted.search("beta receipt", k=5)) == {"a", "b"}
+
+
+def test_broad_filter_uses_postfilter(tmp_path, monkeypatch):
+    from backend import corpus_index
+
+    monkeypatch.setattr(corpus_index, "CORPUS_EXACT_MAX", 3)
+    index = CorpusIndex(str(tmp_path), embed=fake_embed)
+    for number in range(60):
+        index.add_document(f"doc{number}", f"document number {number}", user_id="even" if number % 2 == 0 else "odd")
+
+    narrow = index.search("document number 4", k=5, user_id="even", doc_type="missing")
+    assert narrow["strategy"] == "exact"
+    assert narrow["results"] == []
+
+    broad = index.search("document number 4", k=5, user_id="odd")
+    assert broad["strategy"] == "hnsw_postfilter"
+    assert len(broad["results"]) == 5
+    assert all(hit["user_id"] == "odd" for hit in broad["results"])
+
+    monkeypatch.setattr(corpus_index, "CORPUS_EXACT_MAX", 5000)
+    exact = index.search("document number 4", k=5, user_id="odd")
+    assert exact["strategy"] == "exact"
+    assert documents(broad) == documents(exact)
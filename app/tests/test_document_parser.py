@@ -0,0 +1,45 @@
+import io
+
+import docx
+from PIL import Image
+
+from backend.document_parser import iter_docx_pages
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def docx_bytes(document):
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def test_table_keeps_repeated_cells_and_collects_images():
+    document = docx.Document()
+    table = document.add_table(rows=1, cols=3)
+    table.cell(0, 0).text = "10"
+    table.cell(0, 1).text = "10"
+    table.cell(0, 2).paragraphs[0].add_run().add_picture(io.BytesIO(png_bytes()))
+
+    images = []
+    pages = list(iter_docx_pages(docx_bytes(document), images))
+
+    assert pages == [(1, "10 | 10 | ", "text")]
+    assert len(images) == 1
+
+
+def test_nested_table_is_output_once():
+    document = docx.Document()
+    outer = document.add_table(rows=1, cols=2)
+    outer.cell(0, 0).text = "outer"
+    inner = outer.cell(0, 1).add_table(rows=1, cols=2)
+    inner.cell(0, 0).text = "x"
+    inner.cell(0, 1).text = "y"
+
+    pages = list(iter_docx_pages(docx_bytes(document)))
+
+    assert pages == [(1, "outer | \nx | y", "text")]
@@ -0,0 +1,68 @@
+from concurrent.futures import Future
+
+from backend.services import document_service
+
+
+def test_ocr_pages_in_flight_are_capped(monkeypatch):
+    submitted = []
+    routed = []
+
+    def route_pdf_pages(file_bytes, images):
+        for number in range(1, 11):
+            routed.append(number)
+            yield number, "ocr", f"png {number}"
+
+    def submit_ocr(payload):
+        # Never finishes on its own, so only the cap makes routing wait
+        submitted.append(Future())
+        return submitted[-1]
+
+    def ocr_result(future, timeout):
+        in_flight = len(submitted) - submitted.index(future)
+        assert in_flight <= 3
+        return {"text": f"page {submitted.index(future) + 1}", "timings": {}}
+
+    monkeypatch.setattr(document_service, "OCR_MAX_IN_FLIGHT", 3)
+    monkeypatch.setattr(document_service, "route_pdf_pages", route_pdf_pages)
+    monkeypatch.setattr(document_service, "submit_ocr", submit_ocr)
+    monkeypatch.setattr(document_service, "ocr_result", ocr_result)
+
+    timings = {}
+    pages = []
+    for page in document_service.iter_routed_pdf_pages(b"", [], timings):
+        pages.append(page)
+        # Routing never runs more than the cap ahead of the consumer
+        assert len(routed) - len(pages) <= 3
+
+    assert pages == [(n, f"page {n}", "ocr") for n in range(1, 11)]
+    assert sorted(timings) == list(range(1, 11))
+
+
+def test_failed_page_ocr_is_reported(monkeypatch):
+    def route_pdf_pages(file_bytes, images):
+        yield 1, "text", "born digital"
+        yield 2, "ocr", "png"
+
+    def submit_ocr(payload):
+        future = Future()
+        future.set_result(None)
+        return future
+
+    monkeypatch.setattr(document_service, "route_pdf_pages", route_pdf_pages)
+    monkeypatch.setattr(document_service, "submit_ocr", submit_ocr)
+    monkeypatch.setattr(
+        document_service, "ocr_result",
+        lambda future, timeout: {"text": "[OCR Image Error] tesseract is not installed", "timings": {}},
+    )
+
+    errors = {}
+    pages = list(document_service.iter_routed_pdf_pages(b"", [], {}, errors))
+    assert pages == [(1, "born digital", "text"), (2, "", "ocr")]
+    assert errors == {2: "[OCR Image Error] tesseract is not installed"}
+
+
+def test_results_with_ocr_errors_are_not_cached():
+    result = {"cleaning": {"failed": 0}, "ocr_correction": {"failed": 0}, "ocr_errors": {"pages": 0, "images": 0}}
+    assert document_service.is_cacheable(result)
+    assert not document_service.is_cacheable({**result, "ocr_errors": {"pages": 1, "images": 0}})
+    assert not document_service.is_cacheable({**result, "ocr_errors": {"pages": 0, "images": 2}})
@@ -0,0 +1,51 @@
+import threading
+import time
+
+import numpy as np
+
+from backend.embedding_service import EmbeddingService
+
+
+class FakeModel:
+    # Vector of a text is [its number]; every encode call takes a while
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=None):
+        self.batches.append(list(texts))
+        time.sleep(0.01)
+        return np.array([[float(text.split()[-1])] for text in texts])
+
+
+def running_service(max_batch):
+    service = EmbeddingService(max_batch=max_batch, max_wait_ms=1)
+    service.model = FakeModel()
+    service.worker = threading.Thread(target=service.run, daemon=True)
+    service.worker.start()
+    return service
+
+
+def test_large_request_is_sliced_and_queries_interleave():
+    service = running_service(max_batch=16)
+    document = service.submit([f"chunk {i}" for i in range(200)])
+    time.sleep(0.015)
+    query = service.submit(["query 7"])
+
+    assert query.result(timeout=5) == [[7.0]]
+    assert not document.done()
+    assert document.result(timeout=5) == [[float(i)] for i in range(200)]
+
+    batches = service.model.batches
+    assert max(len(batch) for batch in batches) <= 16
+    # The query went out with the next batch, not after the document
+    query_batch = next(i for i, batch in enumerate(batches) if "query 7" in batch)
+    assert query_batch < len(batches) - 1
+    assert service.stats()["requests"] == 2
+    service.stop()
+
+
+def test_stop_finishes_started_requests():
+    service = running_service(max_batch=4)
+    document = service.submit([f"chunk {i}" for i in range(10)])
+    service.stop()
+    assert document.result(timeout=5) == [[float(i)] for i in range(10)]
@@ -0,0 +1,12 @@
+from backend import vector_store
+from backend.index_registry import document_hash, index_key
+
+
+def test_index_key_depends_on_vector_storage(monkeypatch):
+    monkeypatch.setattr(vector_store, "RAG_VECTOR_STORAGE", "flat")
+    flat = index_key("some document")
+    monkeypatch.setattr(vector_store, "RAG_VECTOR_STORAGE", "pq")
+    pq = index_key("some document")
+
+    assert flat != pq
+    assert flat.startswith(document_hash("some document"))
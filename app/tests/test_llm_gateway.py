@@ -0,0 +1,149 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend import llm_gateway
+from backend.llm_gateway import GatewayError, LLMGateway, SharedTokenBucket, TokenBucket, track_usage
+
+
+class StatusError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class FakeBackend:
+    # Answers with the prompt upper-cased after raising the queued errors
+
+    def __init__(self, errors=(), delay=0.0):
+        self.errors = list(errors)
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    async def generate(self, model_name, parts, generation_config=None, system_instruction=None):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            error = self.errors.pop(0) if self.errors else None
+        try:
+            await asyncio.sleep(self.delay)
+            if error is not None:
+                raise error
+            text = "".join(parts)
+            return text.upper(), {"prompt_tokens": len(text) // 4 + 1, "output_tokens": 3}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_BACKOFF_BASE", 0.0)
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(600)  # 10 per second
+
+    async def drain():
+        await bucket.acquire(600)
+        start = time.monotonic()
+        await bucket.acquire(5)
+        return time.monotonic() - start
+
+    assert asyncio.run(drain()) >= 0.4
+
+
+def test_shared_bucket_is_one_limit_for_all_workers(tmp_path):
+    path = str(tmp_path / "limits.sqlite3")
+    first = SharedTokenBucket(path, "tokens", 600)  # 10 per second
+    second = SharedTokenBucket(path, "tokens", 600)
+
+    async def drain():
+        await first.acquire(600)
+        start = time.monotonic()
+        await second.acquire(5)
+        return time.monotonic() - start
+
+    assert asyncio.run(drain()) >= 0.4
+
+
+def test_gateways_sharing_limits_throttle_each_other(tmp_path):
+    path = str(tmp_path / "limits.sqlite3")
+    first = LLMGateway(backend=FakeBackend(), rpm=6000, tpm=600, limits_path=path)
+    second = LLMGateway(backend=FakeBackend(), rpm=6000, tpm=600, limits_path=path)
+    first.generate("fake", "x" * 2400)
+    start = time.monotonic()
+    second.generate("fake", "y" * 20)
+    assert time.monotonic() - start >= 0.4
+
+
+def test_tokens_per_minute_throttle_calls():
+    gateway = LLMGateway(backend=FakeBackend(), rpm=6000, tpm=600)
+    gateway.generate("fake", "x" * 2400)  # uses the whole bucket
+    start = time.monotonic()
+    gateway.generate("fake", "y" * 20)  # ~6 tokens at 10 tokens per second
+    assert time.monotonic() - start >= 0.4
+
+
+def test_concurrency_is_capped():
+    backend = FakeBackend(delay=0.05)
+    gateway = LLMGateway(backend=backend, max_concurrency=2)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(lambda i: gateway.generate("fake", f"prompt {i}")[0], range(6)))
+    assert results == [f"PROMPT {i}" for i in range(6)]
+    assert backend.max_in_flight == 2
+
+
+@pytest.mark.parametrize("code", [429, 500, 503])
+def test_retryable_status_is_retried(code):
+    backend = FakeBackend(errors=[StatusError(code), StatusError(code)])
+    gateway = LLMGateway(backend=backend, max_retries=3)
+    text, usage = gateway.generate("fake", "hello")
+    assert text == "HELLO"
+    assert usage["retries"] == 2
+    assert backend.calls == 3
+    assert gateway.stats()["models"]["fake"]["retries"] == 2
+
+
+def test_exhausted_retries_raise_gateway_error():
+    backend = FakeBackend(errors=[StatusError(503)] * 5)
+    gateway = LLMGateway(backend=backend, max_retries=2)
+    with pytest.raises(GatewayError) as excinfo:
+        gateway.generate("fake", "hello")
+    assert isinstance(excinfo.value.__cause__, StatusError)
+    assert backend.calls == 3
+    assert gateway.stats()["models"]["fake"]["errors"] == 1
+
+
+def test_client_errors_are_not_retried():
+    backend = FakeBackend(errors=[StatusError(400)])
+    gateway = LLMGateway(backend=backend, max_retries=3)
+    with pytest.raises(GatewayError):
+        gateway.generate("fake", "hello")
+    assert backend.calls == 1
+
+
+def test_usage_is_accounted():
+    gateway = LLMGateway(backend=FakeBackend())
+    with track_usage() as meter:
+        gateway.generate("fake", "a" * 40)
+        asyncio.run(gateway.agenerate("fake", "b" * 80))
+    gateway.generate("fake", "outside the meter")
+
+    assert meter.as_dict() == {
+        "calls": 2,
+        "cached_calls": 0,
+        "prompt_tokens": 11 + 21,
+        "output_tokens": 6,
+        "total_tokens": 38,
+    }
+    stats = gateway.stats()["models"]["fake"]
+    assert stats["calls"] == 3
+    assert stats["output_tokens"] == 9
@@ -0,0 +1,78 @@
+from backend.normalizer import PageNormalizer, line_signature
+
+
+def statement_page(number):
+    return "\n".join([
+        "ACME BANK - ACCOUNT STATEMENT",
+        f"{number + 10:02d}/03/2024 Transfer to savings",
+        f"{45 + number},120.50",
+        "Closing balance",
+        f"{12 + number},004.10",
+        f"Page {number} of 4",
+    ])
+
+
+def run(pages):
+    normalizer = PageNormalizer(warmup=4)
+    out = []
+    for page in pages:
+        out.extend(normalizer.feed(page))
+    out.extend(normalizer.flush())
+    return out
+
+
+def test_repeated_header_and_page_number_are_stripped_after_first_page():
+    pages = run([statement_page(n) for n in range(1, 5)])
+    assert len(pages) == 4
+    assert "ACME BANK" in pages[0]
+    assert "Page 1 of 4" in pages[0]
+    for page in pages[1:]:
+        assert "ACME BANK" not in page
+        assert "Page" not in page
+
+
+def test_repeated_labelled_header_is_kept():
+    pages = [
+        "\n".join([
+            "Account Number: 001234567890",
+            "Statement Period: 01/03/2024 - 31/03/2024",
+            f"Opening entry {number}",
+            "Deposit received",
+            "Transfer made",
+            f"Page {number} of 2",
+        ])
+        for number in (1, 2)
+    ]
+    text = "\n".join(run(pages))
+    assert text.count("Account Number: 001234567890") == 2
+    assert text.count("Statement Period: 01/03/2024 - 31/03/2024") == 2
+    assert "Page 2 of 2" not in text
+
+
+def test_numeric_edge_lines_are_kept():
+    pages = run([statement_page(n) for n in range(1, 5)])
+    for number, page in enumerate(pages, start=1):
+        assert f"{45 + number},120.50" in page
+        assert f"{12 + number},004.10" in page
+        assert "Closing balance" in page
+
+
+def test_only_edge_occurrence_is_removed():
+    pages = [
+        "Company Confidential\nFirst page\nBody one\nText\nMore\nEnd",
+        "Company Confidential\nIntro text\nCompany Confidential\nMore text\nBody\nEnd",
+        "Company Confidential\nThird page\nBody three\nText\nMore\nEnd",
+        "Company Confidential\nFourth page\nBody four\nText\nMore\nEnd",
+    ]
+    first, second = run(pages)[:2]
+    assert first.startswith("Company Confidential")
+    assert second.count("Company Confidential") == 1
+    assert second.startswith("Intro text")
+
+
+def test_numbers_have_no_signature():
+    assert line_signature("45,120.50") == ""
+    assert line_signature("3") == "#"
+    assert line_signature("- 3 -") == "- # -"
+    assert line_signature("Page 3 of 12") == "page # of #"
+    assert line_signature("Invoice No: 1234") == ""
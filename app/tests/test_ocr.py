@@ -0,0 +1,41 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from backend import ocr
+
+
+class FakePool:
+    def __init__(self):
+        self.shut_down = False
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def broken_future(pool):
+    future = Future()
+    future.set_exception(BrokenProcessPool("worker died"))
+    future.pool = pool
+    return future
+
+
+def test_broken_pool_does_not_shut_down_its_replacement(monkeypatch):
+    broken, current = FakePool(), FakePool()
+    monkeypatch.setattr(ocr, "_pool", current)
+
+    result = ocr.ocr_result(broken_future(broken), 1)
+
+    assert result["text"].startswith("[OCR Image Error]")
+    assert broken.shut_down
+    assert not current.shut_down
+    assert ocr._pool is current
+
+
+def test_broken_current_pool_is_replaced(monkeypatch):
+    current = FakePool()
+    monkeypatch.setattr(ocr, "_pool", current)
+
+    ocr.ocr_result(broken_future(current), 1)
+
+    assert current.shut_down
+    assert ocr._pool is None
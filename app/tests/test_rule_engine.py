@@ -0,0 +1,58 @@
+from backend.agents.rule_engine import evaluate_rules, text_fields, validation_report
+
+
+def statuses(rules, fields, text=""):
+    results, pending = evaluate_rules(rules, fields, text)
+    return {result["rule"]: result["status"] for result in results}, pending
+
+
+def test_text_fields_feed_comparison_and_regex_rules():
+    text = "INVOICE\nInvoice No: INV-2024-001\nTotal: 1,250.00\nSee https://example.com\n"
+    fields = text_fields(text)
+    assert fields == {"Invoice No": ["INV-2024-001"], "Total": ["1,250.00"]}
+    results, pending = statuses(["total > 0", r"invoice no matches regex ^INV-\d{4}-\d{3}$"], fields, text)
+    assert results == {"total > 0": "pass", r"invoice no matches regex ^INV-\d{4}-\d{3}$": "pass"}
+    assert pending == []
+
+
+def test_must_have_only_accepts_the_token_form():
+    results, pending = statuses(["must_have_date", "Must have a date"], {}, "Issued 12/03/2024")
+    assert results == {"must_have_date": "pass"}
+    assert pending == ["Must have a date"]
+
+
+def test_exact_key_wins_over_substring_matches():
+    results, pending = statuses(["total > 0"], {"Total": "10", "Discount Total": "0"})
+    assert results == {"total > 0": "pass"}
+    assert pending == []
+
+
+def test_ambiguous_key_goes_to_the_llm():
+    results, pending = statuses(["total > 0"], {"Grand Total": "10", "Discount Total": "0"})
+    assert results == {}
+    assert pending == ["total > 0"]
+
+
+def test_nested_field_is_not_ambiguous():
+    results, pending = statuses(["amount > 0"], {"Invoice": {"Total Amount": "10"}})
+    assert results == {"amount > 0": "pass"}
+    assert pending == []
+
+
+def test_comparison_allows_must_be():
+    results, pending = statuses(["amount must be > 0"], {"Amount": "12.50"})
+    assert results == {"amount must be > 0": "pass"}
+    assert pending == []
+
+
+def test_missing_field_goes_to_the_llm():
+    results, pending = statuses(["Total amount > 0", "gst matches regex ^\\d+$"], {"Amount": "10"})
+    assert results == {}
+    assert pending == ["Total amount > 0", "gst matches regex ^\\d+$"]
+
+
+def test_any_failed_rule_makes_the_document_invalid():
+    results, _ = evaluate_rules(["amount > 0", "amount < 5", "must_contain: amount"], {"Amount": "10"}, "")
+    report = validation_report(results)
+    assert len(report["failed rules"]) == 1
+    assert report["overall_validity"] == "INVALID"